@@ -0,0 +1,260 @@
+"""
+Pub/sub of article changes for the SSE stream (/api/categories/{category}/stream).
+
+The scraper publishes newly saved articles ("added", the compact list
+fields) and the scorer publishes new scores ("scored": id, site_name, score,
+summary, provisional). Every event gets an id "<process>-<sequence>" and the
+last EVENTS_BUFFER events are kept, so a client reconnecting with
+Last-Event-ID gets what it missed. If the id is unknown (older than the
+buffer, another replica, or a restart), the client gets a "reset" event and
+should reload the list.
+
+On PostgreSQL, events are also sent with NOTIFY on the article_events
+channel and a listener thread LISTENs for the events of other replicas (and
+of `python batchScoring.py wait`), so every replica streams every change.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+
+import db
+
+logger = logging.getLogger(__name__)
+
+EVENTS_BUFFER: int = int(os.getenv("EVENTS_BUFFER", "2000"))
+EVENTS_KEEPALIVE: float = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+
+_CHANNEL = "article_events"
+_NOTIFY_MAX_BYTES = 7900    # NOTIFY payloads are limited to 8000 bytes
+_SUBSCRIBER_QUEUE = 1000    # a client further behind than this gets a reset
+_RETRY_MS = 5000
+
+
+@dataclass
+class Event:
+    seq: int
+    kind: str
+    site_name: str
+    data: str
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+class _Subscription:
+    def __init__(self, sites: set[str], start: int):
+        self.sites = sites
+        self.start = start  # events after this sequence number are delivered through the queue
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=_SUBSCRIBER_QUEUE)
+        self.overflowed = False
+
+
+class ArticleEvents:
+    """publish_* may be called from any thread; subscribers live on the event loop."""
+
+    def __init__(self, buffer: int = EVENTS_BUFFER):
+        self._origin = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._buffer: deque[Event] = deque(maxlen=buffer)
+        self._subscribers: set[_Subscription] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._outbox: queue.SimpleQueue[str] = queue.SimpleQueue()
+        self._listener: threading.Thread | None = None
+        self._stop = threading.Event()
+        self.published = 0
+        self.received = 0
+        self.resets = 0
+
+    def start(self) -> None:
+        """Start delivering events; must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        if db._is_postgres() and self._listener is None:
+            self._stop.clear()
+            self._listener = threading.Thread(target=self._listen, name="article-events", daemon=True)
+            self._listener.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+            self._listener = None
+        self._loop = None
+
+    # -- publishing ---------------------------------------------------------
+
+    def publish_added(self, rows: list[dict]) -> None:
+        """Newly saved articles, as db.LIST_FIELDS rows."""
+        self._publish("added", rows)
+
+    def publish_scored(self, rows: list[dict]) -> None:
+        """New scores: dicts with id, site_name, score, summary and provisional."""
+        self._publish("scored", [
+            {key: row.get(key) for key in ("id", "site_name", "score", "summary", "provisional")}
+            for row in rows
+        ])
+
+    def _publish(self, kind: str, rows: list[dict]) -> None:
+        if not rows:
+            return
+        self.published += len(rows)
+        if self._listener is not None:
+            for row in rows:
+                payload = json.dumps({"o": self._origin, "k": kind, "d": row}, default=_json_default)
+                if len(payload.encode()) <= _NOTIFY_MAX_BYTES:
+                    self._outbox.put(payload)
+                else:
+                    logger.debug(f"Event for article {row.get('id')} too large for NOTIFY, only delivered locally")
+        self._call(self._dispatch, kind, rows)
+
+    def _call(self, fn, *args) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            fn(*args)
+        else:
+            loop.call_soon_threadsafe(fn, *args)
+
+    def _dispatch(self, kind: str, rows: list[dict]) -> None:
+        for row in rows:
+            self._seq += 1
+            event = Event(self._seq, kind, row["site_name"], json.dumps(row, default=_json_default))
+            self._buffer.append(event)
+            for sub in self._subscribers:
+                if event.site_name not in sub.sites or sub.overflowed:
+                    continue
+                try:
+                    sub.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    sub.overflowed = True
+
+    # -- PostgreSQL ---------------------------------------------------------
+
+    def _drain_outbox(self) -> list[str]:
+        pending = []
+        while not self._outbox.empty():
+            pending.append(self._outbox.get_nowait())
+        return pending
+
+    def _listen(self) -> None:
+        conn = None
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = db.pg_listen(_CHANNEL)
+                pending = self._drain_outbox()
+                if pending:
+                    db.pg_notify(conn, _CHANNEL, pending)
+                if select.select([conn], [], [], 0.5) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        self._receive(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"Article event listener failed, reconnecting: {e}")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+                self._stop.wait(5)
+        if conn is not None:
+            pending = self._drain_outbox()
+            try:
+                if pending:
+                    db.pg_notify(conn, _CHANNEL, pending)
+            except Exception as e:
+                logger.warning(f"Could not send {len(pending)} article events on shutdown: {e}")
+            conn.close()
+
+    def _receive(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("o") == self._origin:
+            return
+        self.received += 1
+        self._call(self._dispatch, message["k"], [message["d"]])
+
+    # -- subscribing --------------------------------------------------------
+
+    def _replay(self, sub: _Subscription, last_event_id: str) -> list[Event] | None:
+        """
+        Buffered events after last_event_id up to the subscription's start (later
+        ones arrive through its queue), or None if they can't be replayed.
+        """
+        origin, _, seq = last_event_id.rpartition("-")
+        if origin != self._origin or not seq.isdigit():
+            return None
+        after = int(seq)
+        oldest = self._buffer[0].seq if self._buffer else sub.start + 1
+        if after > sub.start or after < oldest - 1:
+            return None
+        return [e for e in self._buffer if after < e.seq <= sub.start and e.site_name in sub.sites]
+
+    def _format(self, event: Event) -> str:
+        return f"id: {self._origin}-{event.seq}\nevent: {event.kind}\ndata: {event.data}\n\n"
+
+    def _reset(self, seq: int) -> str:
+        self.resets += 1
+        return f"id: {self._origin}-{seq}\nevent: reset\ndata: {{}}\n\n"
+
+    async def stream(
+        self, sites: list[str], last_event_id: str | None, is_disconnected: Callable[[], Awaitable[bool]]
+    ) -> AsyncIterator[str]:
+        """Server-sent events for the given sites, resuming after last_event_id if possible."""
+        # Registering and taking the start sequence in one step (no await in
+        # between) splits events exactly between the replay and the queue.
+        sub = _Subscription(set(sites), self._seq)
+        self._subscribers.add(sub)
+        try:
+            yield f"retry: {_RETRY_MS}\n\n"
+            if last_event_id:
+                backlog = self._replay(sub, last_event_id)
+                if backlog is None:
+                    yield self._reset(sub.start)
+                else:
+                    for event in backlog:
+                        yield self._format(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if sub.overflowed:
+                    # Too far behind; have the client reload instead of replaying everything.
+                    yield self._reset(self._seq)
+                    return
+                yield self._format(event)
+        finally:
+            self._subscribers.discard(sub)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "received": self.received,
+            "resets": self.resets,
+            "buffered": len(self._buffer),
+            "pg_listener": self._listener is not None,
+        }
+
+
+article_events = ArticleEvents()
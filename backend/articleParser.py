@@ -0,0 +1,133 @@
+"""
+Process-pool article parsing stage.
+
+Newspaper's HTML parsing and text extraction is CPU-bound and holds the GIL,
+so scrapes parse their downloaded pages here, in a ProcessPoolExecutor with
+PARSE_WORKERS processes (default: one per CPU; 0 parses in a worker thread
+instead). Workers receive raw HTML bytes and return compact parsed records.
+
+Keep this module free of heavy imports (db, config, ...): every worker
+process imports it. helper is fine.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import TypedDict
+
+from helper import normalize_text, simhash
+
+logger = logging.getLogger(__name__)
+
+PARSE_WORKERS: int = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+
+class ParsedArticle(TypedDict):
+    url: str
+    title: str
+    text: str
+    authors: list[str]
+    publish_date: datetime | None
+    simhash: int  # near-duplicate fingerprint of title + text, see storyClusters.py
+
+
+def parse_html(url: str, html: bytes, encoding: str | None, min_word_count: int,
+               validate: bool) -> ParsedArticle | None:
+    """
+    Parse one downloaded page with newspaper. Returns None if parsing fails or,
+    when validate is set, if newspaper doesn't consider the body a real article.
+    Runs inside a worker process.
+    """
+    import newspaper
+    from newspaper import parsers
+
+    try:
+        config = newspaper.Config()
+        config.min_word_count = min_word_count
+        text = html.decode(encoding, errors="replace") if encoding else parsers.get_unicode_html(html)
+        article = newspaper.Article(url, config=config)
+        article.download(input_html=text)
+        article.parse()
+        if not article.is_parsed or not article.text:
+            return None
+        if validate and not article.is_valid_body():
+            return None
+        return {
+            "url": article.url,
+            "title": article.title,
+            "text": article.text,
+            "authors": list(article.authors),
+            "publish_date": article.publish_date,
+            "simhash": simhash(f"{article.title}\n{article.text}"),
+        }
+    except Exception as e:
+        logger.warning(f"Error parsing {url}: {e}")
+        return None
+
+
+def fingerprint(record: ParsedArticle) -> str:
+    """Normalised title+text hash, used to drop the same story found under several URLs."""
+    content = normalize_text((record["title"] or "") + (record["text"] or ""))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the server process has live threads (DB pool, uvicorn).
+        _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def parse_pages(pages: list[tuple[str, bytes, str | None]], min_word_count: int,
+                      validate: bool = True) -> list[ParsedArticle]:
+    """
+    Parse (url, html, encoding) pages in parallel and return the valid records,
+    de-duplicated by content fingerprint, in input order.
+    """
+    loop = asyncio.get_running_loop()
+    if PARSE_WORKERS > 0:
+        pool = _get_pool()
+        futures = [
+            loop.run_in_executor(pool, parse_html, url, html, encoding, min_word_count, validate)
+            for url, html, encoding in pages
+        ]
+    else:
+        futures = [
+            asyncio.to_thread(parse_html, url, html, encoding, min_word_count, validate)
+            for url, html, encoding in pages
+        ]
+    try:
+        results = await asyncio.gather(*futures)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge page); start a fresh pool next time.
+        shutdown()
+        raise
+
+    records: list[ParsedArticle] = []
+    seen: set[str] = set()
+    for record in results:
+        if record is None:
+            continue
+        fp = fingerprint(record)
+        if fp in seen:
+            logger.debug(f"Skipping duplicate article {record['url']}")
+            continue
+        seen.add(fp)
+        records.append(record)
+    return records
+
+
+def shutdown() -> None:
+    """Stop the worker processes. Call on application shutdown."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
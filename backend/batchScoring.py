@@ -0,0 +1,192 @@
+"""
+Offline scoring through the OpenAI-compatible Batch API.
+
+For backfills (e.g. thousands of unscored articles after an outage) the
+realtime endpoint is limited to OPENAI_RATE_LIMIT requests per minute.
+Instead, the pending prompts (the same _build_messages payloads) are written
+to a JSONL file, submitted as one batch job, and the results are ingested
+into the articles table once the job finishes. Batch jobs are usually
+cheaper and aren't subject to the realtime rate limits.
+
+Submitted jobs are recorded in the score_batches table; their articles are
+skipped by the realtime sweep until the job is ingested or fails. The server
+polls pending jobs periodically (poll_pending); the CLI can do it too:
+
+  python batchScoring.py submit [limit]   # queue unscored articles as a batch job
+  python batchScoring.py status           # show pending jobs
+  python batchScoring.py wait             # poll until all pending jobs are ingested
+
+For local testing, point OPENAI_API_BASE at mock_batch_api.py.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+
+import db
+from articleEvents import article_events
+from llmRelevance import MODEL, RelevanceScore, Usage, _build_messages, _response_format, client, parse_score
+from scoreCache import score_cache
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS: int = int(os.getenv("SCORE_BATCH_API_MAX", "50000"))
+BATCH_POLL_SECONDS: float = float(os.getenv("SCORE_BATCH_API_POLL", "60"))
+
+_ENDPOINT = "/v1/chat/completions"
+_FAILED_STATUSES = {"failed", "expired", "cancelled"}
+
+
+def build_requests(article_ids: list[int]) -> tuple[bytes, list[int]]:
+    """Serialise the scoring requests for the given articles to JSONL. Returns (jsonl, ids included)."""
+    lines = []
+    included = []
+    for article in db.get_articles_by_ids(article_ids):
+        if article.score != -1:
+            continue
+        messages, _ = _build_messages(article)
+        if not messages:
+            continue
+        lines.append(json.dumps({
+            "custom_id": str(article.id),
+            "method": "POST",
+            "url": _ENDPOINT,
+            "body": {
+                "model": MODEL,
+                "messages": messages,
+                "response_format": _response_format("relevance_score", RelevanceScore),
+            },
+        }, ensure_ascii=False))
+        included.append(article.id)
+    return ("\n".join(lines) + "\n").encode(), included
+
+
+def _pending_article_ids() -> set[int]:
+    return {article_id for batch in db.get_pending_score_batches() for article_id in batch["article_ids"]}
+
+
+async def submit(limit: int | None = None) -> str | None:
+    """Submit the unscored articles not already in a pending job. Returns the batch id, or None if nothing to do."""
+    pending = await asyncio.to_thread(_pending_article_ids)
+    article_ids = [i for i in await asyncio.to_thread(db.get_unscored_ids) if i not in pending]
+    article_ids = article_ids[:min(limit or BATCH_MAX_REQUESTS, BATCH_MAX_REQUESTS)]
+    if not article_ids:
+        return None
+
+    payload, included = await asyncio.to_thread(build_requests, article_ids)
+    if not included:
+        return None
+    upload = await client.files.create(file=("scores.jsonl", payload), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=upload.id,
+        endpoint=_ENDPOINT,
+        completion_window="24h",
+    )
+    await asyncio.to_thread(db.save_score_batch, batch.id, included)
+    logger.info(f"Submitted batch {batch.id} with {len(included)} articles")
+    return batch.id
+
+
+def parse_results(output: str) -> tuple[dict[int, tuple[int, str]], dict[int, Usage]]:
+    """
+    Parse a Batch API output file into {article id: (score, summary)} and
+    {article id: (prompt tokens, completion tokens)}, skipping failed lines.
+    """
+    results: dict[int, tuple[int, str]] = {}
+    usage: dict[int, Usage] = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            article_id = int(item["custom_id"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+        result = parse_score(content)
+        if result is not None:
+            results[article_id] = result
+            spent = response["body"].get("usage") or {}
+            if "prompt_tokens" in spent:
+                usage[article_id] = (spent["prompt_tokens"], spent.get("completion_tokens", 0))
+    return results, usage
+
+
+async def ingest(batch_id: str) -> str:
+    """
+    Check one job and store its scores if it has finished. Returns the job
+    status; anything but 'completed' or a failure status means it's still running.
+    """
+    batch = await client.batches.retrieve(batch_id)
+    if batch.status != "completed" and batch.status not in _FAILED_STATUSES:
+        return batch.status
+
+    scored = 0
+    # Expired and cancelled jobs may still have a partial output file.
+    if batch.output_file_id:
+        output = (await client.files.content(batch.output_file_id)).text
+        results, usage = parse_results(output)
+        articles = await asyncio.to_thread(db.get_articles_by_ids, list(results))
+        scores = [
+            (article.url, *results[article.id], *usage.get(article.id, (None, None)))
+            for article in articles
+            if article.score == -1
+        ]
+        await asyncio.to_thread(db.set_scores, scores)
+        article_events.publish_scored([
+            {"id": article.id, "site_name": article.site_name, "score": results[article.id][0],
+             "summary": results[article.id][1], "provisional": 0}
+            for article in articles if article.score == -1
+        ])
+        article_events.publish_scored(await asyncio.to_thread(db.propagate_cluster_scores))
+        await score_cache.store(MODEL, articles, results)
+        scored = len(scores)
+    await asyncio.to_thread(db.finish_score_batch, batch_id, batch.status)
+    logger.info(f"Batch {batch_id} {batch.status}: {scored} articles scored")
+    return batch.status
+
+
+async def poll_pending() -> None:
+    """Ingest every pending job that has finished."""
+    for batch in await asyncio.to_thread(db.get_pending_score_batches):
+        try:
+            await ingest(batch["batch_id"])
+        except Exception as e:
+            logger.error(f"Failed to check batch {batch['batch_id']}: {e}")
+
+
+async def _wait() -> None:
+    # Started so ingested scores reach the servers' streams via NOTIFY (PostgreSQL only).
+    article_events.start()
+    try:
+        while pending := await asyncio.to_thread(db.get_pending_score_batches):
+            await poll_pending()
+            if await asyncio.to_thread(db.get_pending_score_batches):
+                print(f"{len(pending)} batch(es) still running, checking again in {BATCH_POLL_SECONDS:.0f}s")
+                await asyncio.sleep(BATCH_POLL_SECONDS)
+    finally:
+        await asyncio.to_thread(article_events.close)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "submit":
+        limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        batch_id = asyncio.run(submit(limit))
+        print(batch_id or "Nothing to submit.")
+    elif command == "wait":
+        asyncio.run(_wait())
+    elif command == "status":
+        for batch in db.get_pending_score_batches():
+            print(f"{batch['batch_id']}  {len(batch['article_ids'])} articles  submitted {batch['submitted_at']}")
+    else:
+        sys.exit(f"Unknown command {command!r} (expected submit, status or wait)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compare source-config lookup cost before and after the cached snapshot.
+
+The "old" path re-implements the previous accessors: parse sources.yaml with
+yaml.safe_load and scan every category on each call. The "new" path is the
+current config module. Both run the lookups _build_messages and scrape do per
+article / per site.
+
+  python benchmark_config.py [iterations]
+"""
+import sys
+import time
+
+import yaml
+
+import config
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+
+def _old_lookup(name: str, key: str):
+    with open(config.CONFIG_PATH, "r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f)
+    for category in raw.get("categories", []):
+        for source in category.get("sources", []):
+            if source["name"].lower() == name.lower():
+                return source.get(key)
+    return None
+
+
+def _bench(label: str, fn) -> float:
+    sites = config.get_all_sites()
+    start = time.perf_counter()
+    for i in range(ITERATIONS):
+        name = sites[i % len(sites)]
+        fn(name)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / ITERATIONS * 1e6
+    print(f"{label:<6} {ITERATIONS} x (preference + language): {elapsed * 1000:9.1f} ms  ({per_call:8.2f} us/article)")
+    return per_call
+
+
+def main() -> None:
+    old = _bench("old", lambda name: (_old_lookup(name, "preference"), _old_lookup(name, "language")))
+    new = _bench("new", lambda name: (config.get_preference(name), config.get_language(name)))
+    print(f"speed-up: {old / new:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark the hot articles-table queries with and without the migration indexes.
+
+Fills a synthetic table (default 1,000,000 rows), then for each query prints
+the median latency and the plan of every statement it ran, first with all
+articles indexes dropped and then with them in place.
+
+  python benchmark_db.py [rows]
+
+Runs against a throwaway SQLite file unless DATABASE_URL points at Postgres
+(in which case the articles table of that database is emptied first — use
+a scratch database).
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+
+import db
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+SITES = [f"site-{i}" for i in range(40)]
+REPEAT = 5
+NOW = datetime(2026, 1, 31)
+
+
+def _fill(rows: int) -> None:
+    rng = random.Random(0)
+    if db._is_postgres():
+        import psycopg2.extras # pyright: ignore[reportMissingModuleSource]
+    with db._get_cursor() as cur:
+        cur.execute("DELETE FROM articles")
+    sql = "INSERT INTO articles (site_name, url, title, text, publish_date, score, created_at) VALUES {}"
+    batch = []
+    for i in range(rows):
+        created = NOW - timedelta(minutes=rng.randrange(60 * 24 * 60))
+        batch.append((
+            rng.choice(SITES),
+            f"https://example.com/{i}",
+            f"Title {i}",
+            "Lorem ipsum " * 20,
+            created - timedelta(minutes=rng.randrange(120)),
+            -1 if rng.random() < 0.01 else rng.randrange(10),
+            created,
+        ))
+        if len(batch) == 50_000 or i == rows - 1:
+            if db._is_postgres():
+                with db._get_cursor() as cur:
+                    psycopg2.extras.execute_values(cur, sql.format("%s"), batch, page_size=len(batch))
+            else:
+                conn = db._get_sqlite_conn()
+                with conn:
+                    conn.executemany(sql.format("(?, ?, ?, ?, ?, ?, ?)"), batch)
+            batch = []
+    with db._get_cursor() as cur:
+        cur.execute("ANALYZE")
+
+
+class _RecordingCursor:
+    def __init__(self, cur, statements: list[tuple[str, tuple]]):
+        self._cur = cur
+        self._statements = statements
+
+    def execute(self, sql: str, params: tuple = ()):
+        self._statements.append((sql, tuple(params)))
+        return self._cur.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+@contextmanager
+def _recording(statements: list[tuple[str, tuple]]):
+    """Record the (sql, params) of every statement db.py executes, to EXPLAIN exactly those."""
+    get_cursor = db._get_cursor
+
+    @contextmanager
+    def recording_cursor(*args, **kwargs):
+        with get_cursor(*args, **kwargs) as cur:
+            yield _RecordingCursor(cur, statements)
+
+    db._get_cursor = recording_cursor
+    try:
+        yield
+    finally:
+        db._get_cursor = get_cursor
+
+
+def _plan(sql: str, params: tuple) -> str:
+    explain = "EXPLAIN" if db._is_postgres() else "EXPLAIN QUERY PLAN"
+    with db._get_cursor() as cur:
+        cur.execute(f"{explain} {sql}", params)
+        rows = cur.fetchall()
+    return "\n".join("    " + str(list(r.values())[-1]) for r in rows)
+
+
+def _indexes() -> list[tuple[str, str]]:
+    """(name, DDL) of every index the migrations created on the articles table."""
+    with db._get_cursor() as cur:
+        if db._is_postgres():
+            cur.execute("SELECT indexname AS name, indexdef AS ddl FROM pg_indexes"
+                        " WHERE tablename = 'articles' AND indexname LIKE 'idx\\_%'")
+        else:
+            cur.execute("SELECT name, sql AS ddl FROM sqlite_master"
+                        " WHERE type = 'index' AND tbl_name = 'articles' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+        return [(row["name"], row["ddl"]) for row in cur.fetchall()]
+
+
+def _time(fn) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def _run(label: str) -> None:
+    p = db._ph()
+    sites = SITES[:5]
+    since = NOW - timedelta(days=1)
+    week = NOW - timedelta(days=7)
+    cutoff = NOW - timedelta(days=30)
+
+    def cleanup_scan() -> None:
+        # delete_old's predicate, without deleting anything.
+        with db._get_cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM articles WHERE publish_date < {p} OR created_at < {p}", (cutoff, cutoff))
+            cur.fetchall()
+
+    def category_page() -> None:
+        db._bump_version(rows_changed=True)  # empty the count cache, so the COUNT(*) runs every time
+        db.get_articles_by_sites_paginated(sites, str(since), None, 20, 0)
+
+    def deep_keyset_page() -> None:
+        # What the frontend asks for: a 7-day window, paged with cursors, 10 pages in.
+        cursor = ""
+        for _ in range(10):
+            _, _, cursor = db.get_articles_by_sites_keyset(sites, str(week), None, 50, cursor, include_total=False)
+            if cursor is None:
+                break
+
+    queries = [
+        ("category page (get_articles_by_sites_paginated)", category_page),
+        ("10 keyset pages, 7-day window (get_articles_by_sites_keyset)", deep_keyset_page),
+        ("unscored articles (get_unscored_ids)", db.get_unscored_ids),
+        ("cleanup scan (delete_old predicate)", cleanup_scan),
+    ]
+    print(f"\n=== {label} ===")
+    for name, fn in queries:
+        statements: list[tuple[str, tuple]] = []
+        with _recording(statements):
+            fn()
+        print(f"\n{name}: {_time(fn):.1f} ms (median of {REPEAT})")
+        distinct: dict[str, tuple] = {}
+        for sql, params in statements:
+            distinct.setdefault(sql, params)
+        for sql, params in distinct.items():
+            print(f"  {sql}")
+            print(_plan(sql, params))
+
+
+def main() -> None:
+    print(f"Filling {ROWS} synthetic rows...")
+    _fill(ROWS)
+
+    indexes = _indexes()
+    with db._get_cursor() as cur:
+        for name, _ in indexes:
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+    _run(f"without indexes ({', '.join(name for name, _ in indexes)} dropped)")
+
+    with db._get_cursor() as cur:
+        for _, ddl in indexes:
+            cur.execute(ddl)
+        cur.execute("ANALYZE")
+    _run("with indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure near-duplicate fingerprinting and clustering on synthetic articles.
+
+Generates ARTICLES random stories, a third of which get a near-duplicate
+copy (a few words changed, a sentence appended), then times helper.simhash
+over all texts and SimHashIndex.assign over the fingerprints, and reports how
+many of the planted duplicates were clustered with their original.
+
+  python benchmark_simhash.py [articles]
+"""
+import random
+import sys
+import time
+
+from helper import simhash
+from storyClusters import CLUSTER_MAX_DISTANCE, SimHashIndex
+
+ARTICLES = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+WORDS = 400
+
+random.seed(1)
+_VOCABULARY = [f"word{i}" for i in range(20000)]
+
+
+def _story() -> str:
+    return " ".join(random.choices(_VOCABULARY, k=WORDS))
+
+
+def _near_duplicate(text: str) -> str:
+    words = text.split()
+    for _ in range(3):
+        words[random.randrange(len(words))] = random.choice(_VOCABULARY)
+    return " ".join(words) + " Reporting by the wire desk."
+
+
+def main() -> None:
+    texts = [_story() for _ in range(ARTICLES)]
+    originals = list(range(0, ARTICLES, 3))
+    texts += [_near_duplicate(texts[i]) for i in originals]
+
+    start = time.perf_counter()
+    fingerprints = [simhash(t) for t in texts]
+    elapsed = time.perf_counter() - start
+    print(f"simhash  {len(texts)} articles: {elapsed * 1000:9.1f} ms  ({elapsed / len(texts) * 1e6:7.1f} us/article)")
+
+    index = SimHashIndex(CLUSTER_MAX_DISTANCE)
+    start = time.perf_counter()
+    clusters = index.assign([(i, fp, None) for i, fp in enumerate(fingerprints)])
+    elapsed = time.perf_counter() - start
+    print(f"assign   {len(texts)} articles: {elapsed * 1000:9.1f} ms  ({elapsed / len(texts) * 1e6:7.1f} us/article)")
+
+    found = sum(1 for n, i in enumerate(originals) if clusters[ARTICLES + n] == i)
+    false = sum(1 for i in range(ARTICLES) if clusters[i] != i)
+    print(f"clustered {found}/{len(originals)} planted duplicates, {false} unrelated articles merged")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,200 @@
-import yaml
+import logging
+import os
+import threading
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping
+
+import yaml
 
 CONFIG_PATH = Path(__file__).parent / "sources.yaml"
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SourceConfig:
+    """One validated source entry from sources.yaml."""
+    name: str
+    category: str
+    url: str | None
+    rss: tuple[str, ...] | None
+    google: str | None
+    preference: str | None
+    language: str | None
+    filter: tuple[str, ...] | None
+    interval: float | None      # scrape interval in minutes; None = default for the source kind
+    max_tokens: int | None      # article text budget for the LLM prompt; None = LLM_MAX_TEXT_TOKENS
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """Immutable, indexed view of sources.yaml as of a given file mtime."""
+    mtime_ns: int
+    categories: tuple[str, ...]
+    sources: tuple[SourceConfig, ...]
+    by_name: Mapping[str, SourceConfig]            # lowercased source name -> source
+    by_category: Mapping[str, tuple[str, ...]]     # lowercased category name -> source names
+
+
+def _str_list(value, field: str, where: str) -> tuple[str, ...] | None:
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"{where}: '{field}' must be a list of strings")
+    return tuple(value)
+
+
+def _interval(value, where: str) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{where}: 'interval' must be a positive number of minutes")
+    return float(value)
+
+
+def _max_tokens(value, where: str) -> int | None:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f"{where}: 'max_tokens' must be a positive integer")
+    return value
 
-def _load_config() -> dict:
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+
+def _parse(raw: dict, mtime_ns: int) -> ConfigSnapshot:
+    """Validate the raw YAML document and build the lookup indexes."""
+    if not isinstance(raw, dict) or not isinstance(raw.get("categories", []), list):
+        raise ValueError("sources.yaml: top level must be a mapping with a 'categories' list")
+
+    categories: list[str] = []
+    sources: list[SourceConfig] = []
+    by_name: dict[str, SourceConfig] = {}
+    by_category: dict[str, tuple[str, ...]] = {}
+
+    for category in raw.get("categories", []):
+        cat_name = category.get("name")
+        if not isinstance(cat_name, str):
+            raise ValueError("sources.yaml: every category needs a 'name'")
+        names: list[str] = []
+        for source in category.get("sources", []) or []:
+            name = source.get("name")
+            if not isinstance(name, str):
+                raise ValueError(f"sources.yaml: source without a 'name' in category '{cat_name}'")
+            if name.lower() in by_name:
+                raise ValueError(f"sources.yaml: duplicate source name '{name}'")
+            where = f"sources.yaml: source '{name}'"
+            entry = SourceConfig(
+                name=name,
+                category=cat_name,
+                url=source.get("url"),
+                rss=_str_list(source.get("rss"), "rss", where),
+                google=source.get("google"),
+                preference=source.get("preference"),
+                language=source.get("language"),
+                filter=_str_list(source.get("filter", []), "filter", where),
+                interval=_interval(source.get("interval"), where),
+                max_tokens=_max_tokens(source.get("max_tokens"), where),
+            )
+            sources.append(entry)
+            by_name[name.lower()] = entry
+            names.append(name)
+        categories.append(cat_name)
+        by_category.setdefault(cat_name.lower(), tuple(names))
+
+    return ConfigSnapshot(
+        mtime_ns=mtime_ns,
+        categories=tuple(categories),
+        sources=tuple(sources),
+        by_name=MappingProxyType(by_name),
+        by_category=MappingProxyType(by_category),
+    )
+
+
+_snapshot: ConfigSnapshot | None = None
+_reload_lock = threading.Lock()
+
+
+def snapshot() -> ConfigSnapshot:
+    """
+    Return the current config snapshot, re-reading sources.yaml only when its
+    mtime has changed. If an edited file fails validation, the previous
+    snapshot stays in use and the error is logged.
+    """
+    global _snapshot
+    mtime_ns = os.stat(CONFIG_PATH).st_mtime_ns
+    current = _snapshot
+    if current is not None and current.mtime_ns == mtime_ns:
+        return current
+
+    with _reload_lock:
+        if _snapshot is not None and _snapshot.mtime_ns == mtime_ns:
+            return _snapshot
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                _snapshot = _parse(yaml.safe_load(f) or {}, mtime_ns)
+            if current is not None:
+                logger.info("Reloaded sources.yaml")
+        except (OSError, yaml.YAMLError, ValueError, AttributeError) as e:
+            if current is None:
+                raise
+            logger.error(f"Ignoring invalid sources.yaml, keeping previous config: {e}")
+            # Remember the bad mtime so we don't re-parse it on every call.
+            _snapshot = ConfigSnapshot(mtime_ns, current.categories, current.sources,
+                                       current.by_name, current.by_category)
+        return _snapshot
+
+
+def get_source(name: str) -> SourceConfig | None:
+    """Return the full config entry for the source matching the given name (case-insensitive)."""
+    return snapshot().by_name.get(name.lower())
 
 
 def get_url(name: str) -> str | None:
     """Return the URL for the source matching the given name (case-insensitive)."""
-    config = _load_config()
-    for category in config.get("categories", []):
-        for source in category.get("sources", []):
-            if source["name"].lower() == name.lower():
-                return source.get("url")
-    return None
+    source = get_source(name)
+    return source.url if source else None
 
 def get_rss(name: str) -> list[str] | None:
     """Return the list of RSS feed URLs for the source matching the given name (case-insensitive)."""
-    config = _load_config()
-    for category in config.get("categories", []):
-        for source in category.get("sources", []):
-            if source["name"].lower() == name.lower():
-                return source.get("rss")
-    return None
+    source = get_source(name)
+    return list(source.rss) if source and source.rss is not None else None
 
 def get_google(name: str) -> str | None:
     """Return the Google News search query for the source matching the given name (case-insensitive)."""
-    config = _load_config()
-    for category in config.get("categories", []):
-        for source in category.get("sources", []):
-            if source["name"].lower() == name.lower():
-                return source.get("google")
-    return None
+    source = get_source(name)
+    return source.google if source else None
 
 def get_all_sites() -> list[str]:
     """Return a list of all site names."""
-    config = _load_config()
-    return [
-        source["name"]
-        for category in config.get("categories", [])
-        for source in category.get("sources", [])
-    ]
+    return [source.name for source in snapshot().sources]
 
 def get_preference(name: str) -> str | None:
     """Return the preference string for the source matching the given name (case-insensitive)."""
-    config = _load_config()
-    for category in config.get("categories", []):
-        for source in category.get("sources", []):
-            if source["name"].lower() == name.lower():
-                return source.get("preference")
-    return None
+    source = get_source(name)
+    return source.preference if source else None
 
 def get_language(name: str) -> str | None:
     """Return the language for the source matching the given name (case-insensitive)."""
-    config = _load_config()
-    for category in config.get("categories", []):
-        for source in category.get("sources", []):
-            if source["name"].lower() == name.lower():
-                return source.get("language")
-    return None
+    source = get_source(name)
+    return source.language if source else None
 
 def get_categories() -> list[str]:
     """Return a list of all category names."""
-    config = _load_config()
-    return [category.get("name") for category in config.get("categories", [])]
+    return list(snapshot().categories)
 
 def get_sites_by_category(category_name: str) -> list[str]:
     """Return a list of site names for the given category name (case-insensitive)."""
-    config = _load_config()
-    for category in config.get("categories", []):
-        if category.get("name").lower() == category_name.lower():
-            return [source["name"] for source in category.get("sources", [])]
-    return []
+    return list(snapshot().by_category.get(category_name.lower(), ()))
 
 def get_filter(name: str) -> list[str] | None:
     """Return the filter list for the source matching the given name (case-insensitive)."""
-    config = _load_config()
-    for category in config.get("categories", []):
-        for source in category.get("sources", []):
-            if source["name"].lower() == name.lower():
-                return source.get("filter", [])
-    return None
\ No newline at end of file
+    source = get_source(name)
+    if source is None:
+        return None
+    return list(source.filter) if source.filter is not None else None
+
+def get_max_tokens(name: str) -> int | None:
+    """Return the LLM text token budget for the source matching the given name (case-insensitive)."""
+    source = get_source(name)
+    return source.max_tokens if source else None
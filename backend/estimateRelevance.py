@@ -1,25 +1,226 @@
 import asyncio
-from db import get_unscored_articles,set_score
+import logging
+import os
+import time
+from collections import deque
+
+import db
+from articleEvents import article_events
 from helper import dataArticle
-from llmRelevance import async_estimate
+from llmRelevance import SCORE_BATCH_SIZE, Usage, async_estimate_many
+from preFilter import pre_filter
+
+logger = logging.getLogger(__name__)
+
+SCORE_FLUSH_SIZE: int = int(os.getenv("SCORE_FLUSH_SIZE", "50"))
+SCORE_FLUSH_SECONDS: float = float(os.getenv("SCORE_FLUSH_SECONDS", "5"))
+SCORE_WORKERS: int = int(os.getenv("SCORE_WORKERS", "4"))
+
+# Latency percentiles are computed over this many recent articles.
+_LATENCY_SAMPLES = 1000
+
+
+class ScoreWriter:
+    """
+    Async write-behind buffer for LLM results.
+
+    Collects (url, score, summary, token usage) rows and writes them with db.set_scores
+    in a worker thread, either when SCORE_FLUSH_SIZE results are pending or
+    every SCORE_FLUSH_SECONDS. Flushes are serialised, so there is a single
+    writer no matter how many scoring coroutines are running. "scored" events
+    are published once the rows are written, so clients that refetch on an
+    event read the new score.
+    """
+
+    def __init__(self, max_batch: int = SCORE_FLUSH_SIZE, interval: float = SCORE_FLUSH_SECONDS):
+        self._max_batch = max_batch
+        self._interval = interval
+        self._pending: list[tuple[str, int, str | None, int | None, int | None]] = []
+        self._events: list[dict] = []  # publish_scored rows, parallel to _pending
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the periodic flusher and write out everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def add(self, article: dataArticle, score: int, summary: str | None,
+                  usage: tuple[int, int] | None = None) -> None:
+        prompt_tokens, completion_tokens = usage if usage else (None, None)
+        self._pending.append((article.url, score, summary, prompt_tokens, completion_tokens))
+        self._events.append(
+            {"id": article.id, "site_name": article.site_name, "score": score, "summary": summary, "provisional": 0}
+        )
+        if len(self._pending) >= self._max_batch:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            events, self._events = self._events, []
+            try:
+                await asyncio.to_thread(db.set_scores, batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} scores, will retry: {e}")
+                self._pending[:0] = batch
+                self._events[:0] = events
+                return
+            article_events.publish_scored(events)
+            try:
+                article_events.publish_scored(await asyncio.to_thread(db.propagate_cluster_scores))
+            except Exception as e:
+                logger.error(f"Failed to copy scores to story cluster members: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.flush()
+
+
+score_writer = ScoreWriter()
+
+
+class ScoreQueue:
+    """
+    In-process queue of article ids waiting for an LLM score.
+
+    The scraper enqueues the ids it has just inserted, and SCORE_WORKERS async
+    workers take up to SCORE_BATCH_SIZE ids at a time, load the articles and
+    score them through async_estimate_many (batched prompts, shared rate
+    limiter). Articles the local pre-filter rates as clearly irrelevant get a
+    provisional score instead (see preFilter.py). An id is only queued once
+    at a time.
+    Articles that fail stay unscored (score = -1); the periodic sweep
+    (sweep_unscored) puts them back in the queue.
+    """
+
+    def __init__(self, workers: int = SCORE_WORKERS):
+        self._workers = workers
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._queued: dict[int, tuple[float, bool]] = {}  # id -> (enqueued at, fresh from a scrape)
+        self._tasks: list[asyncio.Task] = []
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.scored = 0
+        self.failed = 0
+        self.prefiltered = 0
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def put_many(self, article_ids: list[int], fresh: bool = True) -> int:
+        """
+        Queue articles for scoring. `fresh` marks ids that were inserted just
+        now, so their ingest-to-score latency is meaningful. Returns how many
+        ids were newly queued.
+        """
+        now = time.monotonic()
+        added = 0
+        for article_id in article_ids:
+            if article_id in self._queued:
+                continue
+            self._queued[article_id] = (now, fresh)
+            self._queue.put_nowait(article_id)
+            added += 1
+        return added
+
+    async def _work(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < SCORE_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._score(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                pre_filter.discard(batch)
+                logger.error(f"Failed to score articles {batch}: {e}")
+            finally:
+                for article_id in batch:
+                    self._queued.pop(article_id, None)
+                    self._queue.task_done()
+
+    async def _score(self, article_ids: list[int]) -> None:
+        articles = await asyncio.to_thread(db.get_articles_by_ids, article_ids)
+        articles = [article for article in articles if article.score == -1]  # skip already scored
+        if not articles:
+            return
+        loaded = articles
+        articles, provisional = await asyncio.to_thread(pre_filter.split, articles)
+        if provisional:
+            await asyncio.to_thread(db.set_provisional_scores, list(provisional.items()))
+            article_events.publish_scored([
+                {"id": a.id, "site_name": a.site_name, "score": provisional[a.id], "summary": None, "provisional": 1}
+                for a in loaded if a.id in provisional
+            ])
+            article_events.publish_scored(await asyncio.to_thread(db.propagate_cluster_scores))
+            self.prefiltered += len(provisional)
+        usage: dict[int, Usage] = {}
+        results = await async_estimate_many(articles, usage=usage)
+        for article in articles:
+            result = results.get(article.id)
+            if result is None:
+                self.failed += 1
+                pre_filter.discard([article.id])
+                logger.warning(f"Failed to estimate relevance for URL: {article.url}")
+                continue
+            score, summary = result
+            pre_filter.observe(article.id, score)
+            await score_writer.add(article, score, summary, usage.get(article.id))
+            self.scored += 1
+            enqueued_at, fresh = self._queued.get(article.id, (0.0, False))
+            if fresh:
+                self._latencies.append(time.monotonic() - enqueued_at)
+
+    async def join(self) -> None:
+        """Wait until everything queued so far has been processed."""
+        await self._queue.join()
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> float | None:
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1) if latencies else None
 
+        return {
+            "depth": self._queue.qsize(),
+            "in_progress": len(self._queued) - self._queue.qsize(),
+            "workers": self._workers,
+            "scored": self.scored,
+            "failed": self.failed,
+            "prefiltered": self.prefiltered,
+            "ingest_to_score_seconds": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+        }
 
 
-async def async_process_articles() -> None:
-    """Retrieve unscored articles, estimate relevance concurrently, and store in db."""
-    articles = get_unscored_articles()
-    tasks = [_process(article) for article in articles]
-    await asyncio.gather(*tasks, return_exceptions=True)
+score_queue = ScoreQueue()
 
 
-async def _process(article: dataArticle) -> None:
-    if article is None:
-        return
-    if article.score != -1:
-        return  # already scored
-    result = await async_estimate(article)
-    if result is None:
-        print(f"Failed to estimate relevance for URL: {article.url}")
-        return
-    score, summary = result
-    set_score(article.url, score, summary)
\ No newline at end of file
+async def sweep_unscored() -> int:
+    """
+    Queue every unscored article that isn't queued yet (stragglers and failed
+    attempts). Articles in a pending offline batch job are left alone.
+    """
+    article_ids = await asyncio.to_thread(db.get_unscored_ids)
+    batches = await asyncio.to_thread(db.get_pending_score_batches)
+    in_batches = {article_id for batch in batches for article_id in batch["article_ids"]}
+    return score_queue.put_many([i for i in article_ids if i not in in_batches], fresh=False)
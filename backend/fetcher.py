@@ -0,0 +1,141 @@
+"""
+Shared asyncio HTTP fetch layer for scraping.
+
+All feed and article downloads go through one keep-alive httpx client
+(HTTP/2 when the h2 package is installed) with:
+  - a global cap on in-flight requests (FETCH_CONCURRENCY),
+  - a per-host cap (FETCH_PER_HOST) and a minimum delay between request
+    starts to the same host (FETCH_HOST_DELAY seconds),
+  - a per-request timeout (FETCH_TIMEOUT seconds),
+  - retries with exponential back-off on connection errors, 429 and 5xx
+    (FETCH_RETRIES), honouring Retry-After.
+Parsing stays with newspaper; this module only moves bytes.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+FETCH_CONCURRENCY: int = int(os.getenv("FETCH_CONCURRENCY", "32"))
+FETCH_PER_HOST: int = int(os.getenv("FETCH_PER_HOST", "2"))
+FETCH_HOST_DELAY: float = float(os.getenv("FETCH_HOST_DELAY", "0.5"))
+FETCH_TIMEOUT: float = float(os.getenv("FETCH_TIMEOUT", "15"))
+FETCH_RETRIES: int = int(os.getenv("FETCH_RETRIES", "2"))
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_MAX_BACKOFF = 30.0
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401 # pyright: ignore[reportMissingImports]
+        return True
+    except ImportError:
+        return False
+
+
+class _HostState:
+    def __init__(self, per_host: int):
+        self.semaphore = asyncio.Semaphore(per_host)
+        self.lock = asyncio.Lock()
+        self.next_start = 0.0
+
+
+class AsyncFetcher:
+    """Politeness-aware, bounded-concurrency HTTP GET client. Create and use it on one event loop."""
+
+    def __init__(
+        self,
+        concurrency: int = FETCH_CONCURRENCY,
+        per_host: int = FETCH_PER_HOST,
+        host_delay: float = FETCH_HOST_DELAY,
+        timeout: float = FETCH_TIMEOUT,
+        retries: int = FETCH_RETRIES,
+    ):
+        self._concurrency = concurrency
+        self._per_host = per_host
+        self._host_delay = host_delay
+        self._timeout = timeout
+        self._retries = retries
+        self._client: httpx.AsyncClient | None = None
+        self._global: asyncio.Semaphore | None = None
+        self._hosts: dict[str, _HostState] = {}
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=_http2_available(),
+                follow_redirects=True,
+                timeout=self._timeout,
+                limits=httpx.Limits(max_connections=self._concurrency, max_keepalive_connections=self._concurrency),
+            )
+            self._global = asyncio.Semaphore(self._concurrency)
+        return self._client
+
+    async def _wait_turn(self, host: _HostState) -> None:
+        async with host.lock:
+            now = time.monotonic()
+            if host.next_start > now:
+                await asyncio.sleep(host.next_start - now)
+            host.next_start = time.monotonic() + self._host_delay
+
+    async def get(self, url: str, headers: dict[str, str] | None = None) -> httpx.Response | None:
+        """
+        GET url. Returns the final response (any status, including 304 and 4xx)
+        or None if the request still failed at the transport level / with a
+        retryable status after all retries.
+        """
+        client = self._ensure_client()
+        assert self._global is not None
+        host = self._hosts.setdefault(urlsplit(url).netloc.lower(), _HostState(self._per_host))
+
+        for attempt in range(self._retries + 1):
+            delay = None
+            # Queue per host first and take a global slot only for the request
+            # itself, so tasks waiting on a busy or slow host don't hold global
+            # slots that other hosts could use.
+            async with host.semaphore:
+                await self._wait_turn(host)
+                async with self._global:
+                    try:
+                        response = await client.get(url, headers=headers)
+                    except httpx.HTTPError as e:
+                        logger.debug(f"GET {url} failed (attempt {attempt + 1}): {e}")
+                        response = None
+                if response is not None and response.status_code not in _RETRY_STATUSES:
+                    return response
+                if response is not None:
+                    delay = _retry_after(response)
+            if attempt == self._retries:
+                break
+            if delay is None:
+                delay = min(_MAX_BACKOFF, 2 ** attempt) * (0.5 + random.random())
+            await asyncio.sleep(delay)
+
+        logger.warning(f"GET {url} failed after {self._retries + 1} attempts")
+        return None
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._hosts.clear()
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return min(_MAX_BACKOFF, max(0.0, float(value)))
+    except ValueError:
+        return None  # HTTP-date form; fall back to exponential back-off
+
+
+fetcher = AsyncFetcher()
@@ -1,5 +1,11 @@
+import hashlib
+import math
+import re
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
 
 @dataclass
 class dataArticle:
@@ -16,4 +22,93 @@ class dataArticle:
 
     @classmethod
     def from_row(cls, row: dict) -> "dataArticle":
-        return cls(**row)
+        # Ignore extra columns (e.g. the `shuffle` sort key) not part of the model
+        return cls(**{f.name: row[f.name] for f in fields(cls)})
+
+
+# Query parameters that only carry tracking / referral information.
+_TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid",
+    "ocid", "cmpid", "ref", "ref_src", "smid", "sref", "taid", "guccounter",
+}
+
+
+def canonical_url(url: str) -> str:
+    """
+    Reduce an article URL to a canonical dedup key: scheme, "www.", fragment,
+    trailing slash and tracking parameters (utm_* and friends) are dropped,
+    the host is lowercased and the remaining query parameters are sorted.
+    e.g. "https://www.Example.com/a/?utm_source=x&b=2#top" -> "example.com/a?b=2"
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if "@" in host:
+        host = host.rsplit("@", 1)[1]
+    if host.endswith(":80") or host.endswith(":443"):
+        host = host.rsplit(":", 1)[0]
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    key = host + path
+    if query:
+        key += "?" + urlencode(query)
+    return key
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace, so trivially different copies of a story compare equal."""
+    text = re.sub(r"[^\w\s]", "", text.replace("\xa0", " ")).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+_SHINGLE_WORDS = 3
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of the normalised text over word 3-gram shingles.
+    Near-identical texts get fingerprints a few bits apart.
+    """
+    words = normalize_text(text).split()
+    shingles = {" ".join(words[i:i + _SHINGLE_WORDS]) for i in range(max(1, len(words) - _SHINGLE_WORDS + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    # One row of 64 bits per shingle; a fingerprint bit is set where most shingles have it set.
+    bits = np.unpackbits(hashes.astype(">u8").view(np.uint8)).reshape(-1, 64)
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives, ~error_rate false positives)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self._size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self._hashes):
+            yield (h1 + i * h2) % self._size
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
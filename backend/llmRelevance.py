@@ -1,13 +1,21 @@
 import os
 import asyncio
 import json
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+import openai
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionMessageParam
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-from config import get_preference, get_language
+import metrics
+from config import get_preference, get_language, get_max_tokens
 from helper import dataArticle
+from scoreCache import cache_key, score_cache
+from tokenBudget import LLM_MAX_TEXT_TOKENS, count_tokens, trim_text
 
 # region SETUP
 load_dotenv()
@@ -15,6 +23,11 @@ BASE_URL: str = os.getenv("OPENAI_API_BASE") # pyright: ignore[reportAssignmentT
 MODEL: str = os.getenv("OPENAI_MODEL") # pyright: ignore[reportAssignmentType]
 API_KEY: str = os.getenv("OPENAI_API_KEY")# pyright: ignore[reportAssignmentType]
 RATE_LIMIT: int = int(os.getenv("OPENAI_RATE_LIMIT", "10")) # pyright: ignore[reportAssignmentType]
+TOKEN_LIMIT: int = int(os.getenv("OPENAI_TOKEN_LIMIT", "0"))  # tokens per minute, 0 = no token budget
+MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+
+logger = logging.getLogger(__name__)
 
 if BASE_URL is None or MODEL is None or API_KEY is None:
     raise ValueError("Missing required environment variables (OPENAI_API_BASE, OPENAI_MODEL, OPENAI_API_KEY). Please check your .env file or environment configuration.")
@@ -22,6 +35,7 @@ if BASE_URL is None or MODEL is None or API_KEY is None:
 client = AsyncOpenAI(
     base_url=BASE_URL,
     api_key=API_KEY,
+    max_retries=0,  # retries are handled by async_estimate together with the rate limiter
 )
 
 
@@ -30,15 +44,14 @@ class RelevanceScore(BaseModel):
     summary: str = Field(description="2-3 sentence summary adding information not already in the title")
     score: int = Field(ge=0, le=9, description="Relevance score from 0 to 9")
 
-def _build_messages(article: dataArticle) -> tuple[list[ChatCompletionMessageParam], str | None]:
-    """Build the messages list for the API call. Returns (messages, preference) or ([], None) if skipped."""
-    preference = get_preference(article.site_name)
-    if preference is None:
-        return [], None
+class BatchRelevanceItem(RelevanceScore):
+    id: int = Field(description="Id of the article this item scores")
 
-    language = get_language(article.site_name) or "English"
+class BatchRelevanceScores(BaseModel):
+    items: list[BatchRelevanceItem] = Field(description="Exactly one item per article in the request")
 
-    system_msg = (
+def _system_prompt(language: str) -> str:
+    return (
         "You are a strict relevance scorer and summarizer. "
         "You will receive the reader's interests and an article. "
         f"CRITICAL RULE: The summary MUST be written entirely in {language}. "
@@ -77,10 +90,24 @@ def _build_messages(article: dataArticle) -> tuple[list[ChatCompletionMessagePar
         "Score: 1"
     )
 
+def _article_text(article: dataArticle) -> str:
+    """Article text trimmed to the source's token budget."""
+    max_tokens = get_max_tokens(article.site_name) or LLM_MAX_TEXT_TOKENS
+    return trim_text(article.text or "", article.title or "", max_tokens, MODEL)
+
+def _build_messages(article: dataArticle) -> tuple[list[ChatCompletionMessageParam], str | None]:
+    """Build the messages list for the API call. Returns (messages, preference) or ([], None) if skipped."""
+    preference = get_preference(article.site_name)
+    if preference is None:
+        return [], None
+
+    language = get_language(article.site_name) or "English"
+    system_msg = _system_prompt(language)
+
     user_msg = (
         f"Reader interest: '{preference}'\n\n"
         f"Title: {article.title}\n\n"
-        f"Text: {article.text}"
+        f"Text: {_article_text(article)}"
     )
 
     messages: list[ChatCompletionMessageParam] = [
@@ -89,54 +116,377 @@ def _build_messages(article: dataArticle) -> tuple[list[ChatCompletionMessagePar
     ]
     return messages, preference
 
+def _build_batch_messages(articles: list[dataArticle]) -> list[ChatCompletionMessageParam]:
+    """Build one request scoring several articles. All of them must share the site's preference and language."""
+    preference = get_preference(articles[0].site_name)
+    language = get_language(articles[0].site_name) or "English"
+
+    system_msg = _system_prompt(language) + (
+        "\n\nThis request contains several articles, each introduced by its id. "
+        "Summarize and score every article independently of the others, and return "
+        "exactly one item per article, carrying that article's id."
+    )
+    parts = [f"Reader interest: '{preference}'"]
+    for article in articles:
+        parts.append(
+            f"=== Article id: {article.id} ===\n"
+            f"Title: {article.title}\n\n"
+            f"Text: {_article_text(article)}"
+        )
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+def _batch_key(article: dataArticle) -> tuple[str, str] | None:
+    """Articles with the same key can share a batched request (None: not scored at all)."""
+    preference = get_preference(article.site_name)
+    if preference is None:
+        return None
+    return preference, get_language(article.site_name) or "English"
+
 # region ASYNC
+_BURST_SECONDS = 10.0       # bucket capacity, in seconds' worth of the current rate
+_MIN_RATE_FACTOR = 0.1
+_AIMD_INCREASE = 0.05       # rate factor regained per successful request
+_AIMD_DECREASE = 0.5        # rate factor kept after a 429
+_DECREASE_COOLDOWN = 5.0    # concurrent 429s within this window count as one
+_MAX_BACKOFF = 60.0
+# Headroom for the completion when estimating a request's tokens.
+_COMPLETION_TOKENS = 300
+
+SCORE_BATCH_SIZE: int = int(os.getenv("SCORE_BATCH_SIZE", "5"))  # articles per request, 1 = no batching
+
+
 class AsyncRateLimiter:
-    """Enforces a minimum delay between requests using an async lock. (requests per minute)"""
+    """
+    Token-bucket limiter for LLM calls.
 
-    def __init__(self, rate_limit: int):
-        self._delay = 60.0 / rate_limit
+    Requests wait for both a request-per-minute bucket (rate_limit) and, if
+    token_limit is set, a token-per-minute bucket charged with each request's
+    estimated tokens (corrected with the real usage afterwards). At most
+    max_concurrency requests are in flight. Both rates are scaled by an AIMD
+    factor: halved on a 429 (and paused for Retry-After), then raised a little
+    after every success.
+    """
+
+    def __init__(self, rate_limit: int, token_limit: int = TOKEN_LIMIT, max_concurrency: int = MAX_CONCURRENCY):
+        self._rpm = rate_limit
+        self._tpm = token_limit
+        self._factor = 1.0
+        now = time.monotonic()
+        self._requests = self._capacity(rate_limit)
+        self._tokens = self._capacity(token_limit)
+        self._refilled_at = now
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
         self._lock = asyncio.Lock()
-        self._last_request: float = 0
+        self._max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.tokens_used = 0
+
+    def _capacity(self, per_minute: int) -> float:
+        return max(1.0, per_minute * self._factor * _BURST_SECONDS / 60)
 
-    async def acquire(self) -> None:
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._requests = min(self._capacity(self._rpm), self._requests + elapsed * self._rpm * self._factor / 60)
+        if self._tpm:
+            self._tokens = min(self._capacity(self._tpm), self._tokens + elapsed * self._tpm * self._factor / 60)
+
+    async def _wait_budget(self, tokens: int) -> None:
+        # FIFO: waiters queue on the lock, the head waits for the buckets to refill.
         async with self._lock:
-            now = asyncio.get_event_loop().time()
-            wait = self._delay - (now - self._last_request)
-            if wait > 0:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                # A request larger than the whole token bucket goes once the bucket is full.
+                need_tokens = min(tokens, self._capacity(self._tpm)) if self._tpm else 0
+                waits = [self._paused_until - now]
+                if self._requests < 1:
+                    waits.append((1 - self._requests) * 60 / (self._rpm * self._factor))
+                if self._tokens < need_tokens:
+                    waits.append((need_tokens - self._tokens) * 60 / (self._tpm * self._factor))
+                wait = max(waits)
+                if wait <= 0:
+                    self._requests -= 1
+                    if self._tpm:
+                        self._tokens -= tokens
+                    return
                 await asyncio.sleep(wait)
-            self._last_request = asyncio.get_event_loop().time()
-_default_rate_limiter = AsyncRateLimiter(RATE_LIMIT)
 
-async def async_estimate(
-    article: dataArticle,
-    rate_limiter: AsyncRateLimiter = _default_rate_limiter,
-) -> tuple[int, str] | None:
-    """Async version of estimate(). Respects rate limiting via the shared rate_limiter."""
-    messages, preference = _build_messages(article)
-    if not messages:
-        return None
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        """Hold one concurrency slot after paying `tokens` (estimated) from the budget."""
+        async with self._semaphore:
+            await self._wait_budget(tokens)
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    def on_success(self, estimated_tokens: int, used_tokens: int | None) -> None:
+        if used_tokens is not None:
+            self.tokens_used += used_tokens
+            if self._tpm:
+                self._tokens -= used_tokens - estimated_tokens
+        self._factor = min(1.0, self._factor + _AIMD_INCREASE)
+
+    def on_rate_limited(self, retry_after: float | None) -> None:
+        self.throttled += 1
+        now = time.monotonic()
+        if retry_after is not None:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        if now - self._last_decrease >= _DECREASE_COOLDOWN:
+            self._last_decrease = now
+            self._factor = max(_MIN_RATE_FACTOR, self._factor * _AIMD_DECREASE)
+            logger.warning(f"LLM rate limited, slowing down to {self._factor:.0%} of the configured rate")
 
-    await rate_limiter.acquire()
-
-    response = await client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-        response_format={
-            "type": "json_schema",
-            "json_schema": {
-                "name": "relevance_score",
-                "strict": True,
-                "schema": RelevanceScore.model_json_schema(),
-            },
+    def stats(self) -> dict:
+        return {
+            "requests_per_minute": round(self._rpm * self._factor, 1),
+            "tokens_per_minute": round(self._tpm * self._factor) if self._tpm else None,
+            "rate_factor": round(self._factor, 2),
+            "in_flight": self.in_flight,
+            "max_concurrency": self._max_concurrency,
+            "requests": self.requests,
+            "rate_limited": self.throttled,
+            "tokens_used": self.tokens_used,
+        }
+
+rate_limiter = AsyncRateLimiter(RATE_LIMIT)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when a request still fails after MAX_RETRIES retries."""
+
+
+# (prompt tokens, completion tokens) spent on an article
+Usage = tuple[int, int]
+
+LLM_SECONDS = metrics.Histogram(
+    "llm_request_duration_seconds", "Duration of single LLM API calls by outcome (ok or the error class).", ("outcome",),
+)
+LLM_TOKENS = metrics.Counter("llm_tokens_total", "Tokens reported by the LLM API.", ("kind",))
+LLM_ERRORS = metrics.Counter(
+    "llm_errors_total", "Failed LLM calls by error class; LLMUnavailableError counts give-ups after retries.", ("error",),
+)
+
+
+def _estimate_tokens(messages: list[ChatCompletionMessageParam], completions: int = 1) -> int:
+    prompt = sum(count_tokens(str(m.get("content") or ""), MODEL) for m in messages)
+    return prompt + completions * _COMPLETION_TOKENS
+
+
+def _retry_after(response) -> float | None:
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+def _response_format(schema_name: str, schema: type[BaseModel]) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": schema_name,
+            "strict": True,
+            "schema": schema.model_json_schema(),
         },
-    )
+    }
 
+
+def parse_score(raw: str | None) -> tuple[int, str] | None:
+    """Parse a single-article RelevanceScore answer. Returns None if it isn't valid."""
     try:
-        raw = response.choices[0].message.content
         if not raw:
             return None
         parsed = json.loads(raw)
         return int(parsed["score"]), parsed["summary"]
-    except (KeyError, json.JSONDecodeError, TypeError):
+    except (KeyError, json.JSONDecodeError, TypeError, ValueError):
         return None
-    
\ No newline at end of file
+
+
+async def _complete(
+    messages: list[ChatCompletionMessageParam],
+    schema_name: str,
+    schema: type[BaseModel],
+    rate_limiter: AsyncRateLimiter,
+    label: str,
+    completions: int = 1,
+) -> tuple[str | None, Usage | None]:
+    """
+    Run one structured-output chat completion and return its raw content and
+    token usage (None if the provider doesn't report it).
+    Rate limits, timeouts and 5xx errors are retried with exponential back-off
+    (honouring Retry-After); if they persist, LLMUnavailableError is raised.
+    """
+    estimated = _estimate_tokens(messages, completions)
+    for attempt in range(MAX_RETRIES + 1):
+        delay = None
+        async with rate_limiter.slot(estimated):
+            start = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    response_format=_response_format(schema_name, schema),  # pyright: ignore[reportArgumentType]
+                )
+            except openai.RateLimitError as e:
+                delay = _retry_after(e.response)
+                rate_limiter.on_rate_limited(delay)
+                error: Exception = e
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                error = e
+            except Exception as e:
+                _observe_call(start, type(e).__name__)
+                raise
+            else:
+                _observe_call(start, "ok")
+                usage = (response.usage.prompt_tokens, response.usage.completion_tokens) if response.usage else None
+                if usage:
+                    LLM_TOKENS.inc(usage[0], kind="prompt")
+                    LLM_TOKENS.inc(usage[1], kind="completion")
+                rate_limiter.on_success(estimated, sum(usage) if usage else None)
+                return response.choices[0].message.content, usage
+            _observe_call(start, type(error).__name__)
+        if attempt == MAX_RETRIES:
+            LLM_ERRORS.inc(error=LLMUnavailableError.__name__)
+            raise LLMUnavailableError(f"Scoring {label} failed after {MAX_RETRIES + 1} attempts: {error}")
+        if delay is None:
+            delay = min(_MAX_BACKOFF, 2 ** attempt) * (0.5 + random.random())
+        logger.info(f"LLM request for {label} failed ({error}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+    return None, None
+
+
+def _observe_call(start: float, outcome: str) -> None:
+    LLM_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+    if outcome != "ok":
+        LLM_ERRORS.inc(error=outcome)
+
+
+def _add_usage(usage: dict[int, Usage] | None, article_id: int, spent: Usage) -> None:
+    if usage is not None:
+        prompt, completion = usage.get(article_id, (0, 0))
+        usage[article_id] = (prompt + spent[0], completion + spent[1])
+
+
+async def async_estimate(
+    article: dataArticle,
+    rate_limiter: AsyncRateLimiter = rate_limiter,
+    usage: dict[int, Usage] | None = None,
+) -> tuple[int, str] | None:
+    """
+    Async version of estimate(). Respects rate limiting via the shared rate_limiter.
+    Returns None if the source has no preference or the answer can't be parsed;
+    raises LLMUnavailableError if the API keeps failing, so the article stays
+    unscored and is picked up again later. Token usage is added to `usage`.
+    """
+    messages, preference = _build_messages(article)
+    if not messages:
+        return None
+
+    raw, spent = await _complete(messages, "relevance_score", RelevanceScore, rate_limiter, article.url)
+    if spent:
+        _add_usage(usage, article.id, spent)
+    return parse_score(raw)
+
+
+async def _estimate_batch(
+    articles: list[dataArticle],
+    rate_limiter: AsyncRateLimiter,
+    usage: dict[int, Usage] | None,
+) -> dict[int, tuple[int, str]]:
+    """Score articles sharing one preference in a single request; missing or invalid items fall back to single calls."""
+    results: dict[int, tuple[int, str]] = {}
+    if len(articles) > 1:
+        label = f"{len(articles)} articles of {articles[0].site_name}"
+        raw, spent = await _complete(_build_batch_messages(articles), "relevance_scores", BatchRelevanceScores,
+                                     rate_limiter, label, completions=len(articles))
+        if spent:
+            # Attribute the request's usage to its articles in proportion to their text size.
+            sizes = [count_tokens(_article_text(article), MODEL) + 1 for article in articles]
+            total = sum(sizes)
+            for article, size in zip(articles, sizes):
+                _add_usage(usage, article.id, (round(spent[0] * size / total), round(spent[1] / len(articles))))
+        try:
+            wanted = {article.id for article in articles}
+            for item in BatchRelevanceScores.model_validate_json(raw or "").items:
+                if item.id in wanted and item.id not in results:
+                    results[item.id] = (item.score, item.summary)
+        except ValueError as e:
+            logger.warning(f"Unparseable batch answer for {label}, scoring one by one: {e}")
+
+    for article in articles:
+        if article.id in results:
+            continue
+        result = await async_estimate(article, rate_limiter, usage)
+        if result is not None:
+            results[article.id] = result
+    return results
+
+
+async def async_estimate_many(
+    articles: list[dataArticle],
+    rate_limiter: AsyncRateLimiter = rate_limiter,
+    batch_size: int = SCORE_BATCH_SIZE,
+    usage: dict[int, Usage] | None = None,
+) -> dict[int, tuple[int, str]]:
+    """
+    Score several articles, packing up to batch_size articles with the same
+    preference and language into one request. Results are looked up in and
+    saved to the score cache, and identical articles within the call are only
+    sent once. Returns {article id: (score, summary)} for the articles that
+    got a score; the others stay unscored. If given, `usage` is filled with
+    the tokens spent per article id (0 for cache hits and duplicates).
+    """
+    results = await score_cache.lookup(MODEL, articles)
+
+    # One representative per identical prompt; its result is copied to the rest.
+    representatives: dict[str, dataArticle] = {}
+    copies: dict[int, int] = {}
+    groups: dict[tuple[str, str], list[dataArticle]] = {}
+    for article in articles:
+        if article.id in results:
+            continue
+        key = _batch_key(article)
+        if key is None:
+            continue
+        content_key = cache_key(MODEL, article) or str(article.id)
+        if content_key in representatives:
+            copies[article.id] = representatives[content_key].id
+            continue
+        representatives[content_key] = article
+        groups.setdefault(key, []).append(article)
+    size = max(1, batch_size)
+    chunks = [group[i:i + size] for group in groups.values() for i in range(0, len(group), size)]
+    outcomes = await asyncio.gather(*(_estimate_batch(chunk, rate_limiter, usage) for chunk in chunks),
+                                    return_exceptions=True)
+
+    scored: dict[int, tuple[int, str]] = {}
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"Failed to score {len(chunk)} articles of {chunk[0].site_name}: {outcome}")
+            continue
+        scored.update(outcome)
+    await score_cache.store(MODEL, list(representatives.values()), scored)
+
+    for article_id in results:
+        _add_usage(usage, article_id, (0, 0))  # cache hits
+    results.update(scored)
+    for article_id, representative_id in copies.items():
+        if representative_id in scored:
+            results[article_id] = scored[representative_id]
+            _add_usage(usage, article_id, (0, 0))
+    return results
@@ -4,101 +4,153 @@ from datetime import datetime, timedelta
 import logging
 from contextlib import asynccontextmanager
 
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
+import articleParser
+from articleEvents import article_events
+import batchScoring
 import config
 import db 
-from estimateRelevance import async_process_articles
-from scrapeSite import scrape
-import config
+import metrics
+from estimateRelevance import score_queue, score_writer, sweep_unscored
+from fetcher import fetcher
+from llmRelevance import MODEL, rate_limiter
+from preFilter import pre_filter
+from responseCache import CachedBody, ResponseCache, dumps, etag_matches
+from scoreCache import score_cache
+from scrapeSite import feed_stats, scrape
+from sourceScheduler import SCRAPE_TICK_SECONDS, SourceScheduler
+from storyClusters import story_clusters
+from tokenBudget import load_encoding
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
+response_cache = ResponseCache(db.data_version)
+
+MAX_PAGE_SIZE = 5000
+
+JOB_SECONDS = metrics.Histogram("job_run_duration_seconds", "Duration of scheduled background jobs.", ("job",))
+JOB_OVERLAPS = metrics.Counter(
+    "job_overlap_total", "Scheduled job runs skipped because the previous run was still going.", ("job",),
+)
 
 
 # --- Background tasks ---
 
 
-async def task_scrape_crawl() -> None:
-    """Scrape all sources from config and save new articles to DB."""
-    tasks = []
-    for name in config.get_all_sites():
-        if not config.get_rss(name):
-            tasks.append(asyncio.to_thread(scrape, name))
-    await asyncio.gather(*tasks)
-
-async def task_scrape_rss() -> None:
-    """Scrape all sources from config and save new articles to DB."""
-    tasks = []
-    for name in config.get_all_sites():
-        if config.get_rss(name):
-            tasks.append(asyncio.to_thread(scrape, name))
-    await asyncio.gather(*tasks)
-
-async def task_scrape_google() -> None:
-    """Scrape all sources from config and save new articles to DB."""
-    # TODO: If we have more gnews sources, might hit rate-limit
-    tasks = []
-    for name in config.get_all_sites():
-        if config.get_google(name):
-            tasks.append(asyncio.to_thread(scrape, name))
-    await asyncio.gather(*tasks)
-
-async def task_score_unscored() -> None:
-    """Score all articles that have not been scored yet."""
-    logger.info("Scoring unscored articles...")
-    await async_process_articles()
+async def task_scrape(name: str) -> list[int]:
+    """
+    Scrape one source and queue its new articles for scoring right away.
+    Near-duplicates of a known story aren't queued; they share its score.
+    """
+    article_ids = await scrape(name)
+    article_events.publish_added(await asyncio.to_thread(db.get_list_rows, article_ids))
+    to_score = await asyncio.to_thread(story_clusters.assign, article_ids)
+    score_queue.put_many(to_score)
+    return article_ids
+
+source_scheduler = SourceScheduler(task_scrape)
+
+async def task_sweep_unscored() -> None:
+    """Re-queue articles that are still unscored (failed or missed by the queue)."""
+    queued = await sweep_unscored()
+    if queued:
+        logger.info(f"Queued {queued} unscored articles for scoring.")
+
+async def task_ingest_score_batches() -> None:
+    """Store the results of finished offline scoring batches (see batchScoring.py)."""
+    await batchScoring.poll_pending()
+
+async def task_train_prefilter() -> None:
+    """Retrain the local pre-filter on the latest LLM scores."""
+    await asyncio.to_thread(pre_filter.retrain)
 
 def task_cleanup_old() -> None:
-    """Delete articles older than 30 days."""
+    """Delete articles older than 30 days and expire old story fingerprints."""
     cutoff = datetime.now() - timedelta(days=30)
     db.delete_old(cutoff)
+    story_clusters.warm()
+
+def _timed_job(job_id: str, fn):
+    return metrics.timed(JOB_SECONDS, "job", name=job_id)(fn)
+
+def _on_job_overlap(event) -> None:
+    JOB_OVERLAPS.inc(job=event.job_id)
+
+metrics.Gauge("scrape_in_flight", "Scrapes currently running.",
+              callback=lambda: {(): source_scheduler.stats()["in_flight"]})
+metrics.Gauge("score_queue_depth", "Articles waiting in the scoring queue.",
+              callback=lambda: {(): score_queue.stats()["depth"]})
+metrics.Gauge("llm_in_flight", "LLM requests in flight.", callback=lambda: {(): rate_limiter.in_flight})
+metrics.Gauge("llm_rate_factor", "Share of the configured LLM rate currently allowed (lowered after 429s).",
+              callback=lambda: {(): rate_limiter.stats()["rate_factor"]})
+metrics.Gauge("db_pool_in_use", "PostgreSQL connections checked out of the pool.",
+              callback=lambda: {(): db.pool_stats().get("in_use", 0)})
+metrics.Gauge("stream_subscribers", "Open article event streams.",
+              callback=lambda: {(): article_events.stats()["subscribers"]})
 
 # --- FastAPI app ---
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    scheduler.add_listener(_on_job_overlap, EVENT_JOB_MAX_INSTANCES)
     scheduler.add_job(
-        task_scrape_crawl,
-        IntervalTrigger(minutes=60, start_date=datetime.now()+timedelta(minutes=8)),
-        id="scrape_crawl",
+        _timed_job("scrape", source_scheduler.tick),
+        IntervalTrigger(seconds=SCRAPE_TICK_SECONDS),
+        id="scrape",
         replace_existing=True,
     )
     scheduler.add_job(
-        task_scrape_rss,
-        IntervalTrigger(minutes=10, start_date=datetime.now()+timedelta(minutes=1)),
-        id="scrape_rss",
+        _timed_job("score_sweep", task_sweep_unscored),
+        IntervalTrigger(minutes=60, start_date=datetime.now()+timedelta(minutes=2)),
+        id="score_sweep",
         replace_existing=True,
     )
     scheduler.add_job(
-        task_scrape_google,
-        IntervalTrigger(minutes=30, start_date=datetime.now()+timedelta(minutes=3)),
-        id="scrape_google",
+        _timed_job("score_batches", task_ingest_score_batches),
+        IntervalTrigger(minutes=5, start_date=datetime.now()+timedelta(minutes=1)),
+        id="score_batches",
         replace_existing=True,
     )
     scheduler.add_job(
-        task_score_unscored,
-        IntervalTrigger(minutes=60, start_date=datetime.now()+timedelta(minutes=31)),
-        id="score",
+        _timed_job("prefilter_train", task_train_prefilter),
+        IntervalTrigger(hours=6),
+        id="prefilter_train",
         replace_existing=True,
     )
     scheduler.add_job(
-        task_cleanup_old,
+        _timed_job("cleanup", task_cleanup_old),
         trigger="cron",
         hour=2,
         id="cleanup",
         replace_existing=True,
     )
+    await asyncio.to_thread(db.warm_url_filter)
+    await asyncio.to_thread(story_clusters.warm)
+    await asyncio.to_thread(load_encoding, MODEL)
+    await task_train_prefilter()
+    article_events.start()
+    score_writer.start()
+    score_queue.start()
     scheduler.start()
     logger.info("Scheduler started.")
     yield
     scheduler.shutdown()
+    await source_scheduler.aclose()
     logger.info("Scheduler stopped.")
+    await score_queue.close()
+    await score_writer.close()
+    article_events.close()
+    await fetcher.aclose()
+    articleParser.shutdown()
+    db.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -110,6 +162,7 @@ app.add_middleware(
     allow_methods=["GET"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # --- API endpoints ---
@@ -119,16 +172,109 @@ api_router = APIRouter(prefix="/api")
 def list_categories():
     return config.get_categories()
 
+# Clients may keep responses but must revalidate them; with the ETag that's a 304.
+_REVALIDATE = "no-cache"
+
+def _json_response(request: Request, entry: CachedBody, cache_control: str = _REVALIDATE) -> Response:
+    """Serve a serialised body compressed as the client accepts, or 304 if its ETag still matches."""
+    body, coding, etag = entry.encoded(request.headers.get("accept-encoding"))
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _since_bucket(since: str | None) -> str | None:
+    """Truncate an ISO `since` to the minute so near-identical requests share a cache entry."""
+    if since and len(since) > 16 and since[10] == "T" and since[16] == ":":
+        return since[:16]
+    return since
+
 @api_router.get("/categories/{category}/articles")
 def list_articles_by_category(
+    request: Request,
     category: str,
     since: str | None = None,   # ISO datetime
     until: str | None = None,   # ISO datetime
-    limit: int = 1000,
-    offset: int = 0,
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = None,  # opaque keyset cursor; pass "" for the first page
+    include_total: bool = True,
+    fields: str | None = None,  # comma-separated; defaults to db.LIST_FIELDS (no full text)
+    collapse: bool = False,     # one article per story cluster
 ):
+    try:
+        selected = db.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    since = _since_bucket(since)
+    key = (category.lower(), since, until, limit, offset, cursor, include_total, selected, collapse)
+    entry = response_cache.get(key)
+    if entry is not None:
+        return _json_response(request, entry)
+
+    version = db.data_version()
     sites = config.get_sites_by_category(category)
-    articles, total = db.get_articles_by_sites_paginated(sites, since, until, limit, offset)
-    return {"articles": articles, "total": total}
+    if cursor is not None:
+        try:
+            articles, total, next_cursor = db.get_articles_by_sites_keyset(
+                sites, since, until, limit, cursor, include_total, selected, collapse
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        payload = {"articles": articles, "total": total, "has_more": next_cursor is not None, "next_cursor": next_cursor}
+    else:
+        articles, total, has_more = db.get_articles_by_sites_paginated(
+            sites, since, until, limit, offset, include_total, selected, collapse
+        )
+        payload = {"articles": articles, "total": total, "has_more": has_more}
+
+    entry = response_cache.put(key, dumps(payload), version)
+    return _json_response(request, entry)
+
+@api_router.get("/categories/{category}/stream")
+async def stream_category(category: str, request: Request, last_event_id: str | None = Header(None)):
+    """
+    Server-sent events with the category's new articles ("added") and new
+    scores ("scored"). Reconnecting with Last-Event-ID resumes; a "reset"
+    event means the list should be reloaded.
+    """
+    sites = config.get_sites_by_category(category)
+    if not sites:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return StreamingResponse(
+        article_events.stream(sites, last_event_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/articles/{article_id}")
+def get_article(request: Request, article_id: int):
+    article = db.get_article(article_id)
+    if article is None:
+        raise HTTPException(status_code=404, detail="Article not found")
+    return _json_response(request, CachedBody(dumps(article), db.data_version()))
+
+@api_router.get("/stats")
+def get_stats():
+    return {
+        "response_cache": response_cache.stats(),
+        "db_pool": db.pool_stats(),
+        "feeds": feed_stats(),
+        "scheduler": source_scheduler.stats(),
+        "scoring": score_queue.stats(),
+        "llm": rate_limiter.stats(),
+        "score_cache": score_cache.stats(),
+        "story_clusters": story_clusters.stats(),
+        "prefilter": pre_filter.stats(),
+        "events": article_events.stats(),
+        "url_filter": db.url_filter_stats(),
+    }
+
+app.include_router(api_router)
 
-app.include_router(api_router)
\ No newline at end of file
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of the metrics in metrics.py."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
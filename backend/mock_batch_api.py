@@ -0,0 +1,136 @@
+"""
+Local stand-in for the OpenAI Files + Batch API, for trying batchScoring.py
+without a provider account. Jobs "complete" MOCK_BATCH_DELAY seconds after
+submission with a deterministic fake score for every request.
+
+  uvicorn mock_batch_api:app --port 8900
+  OPENAI_API_BASE=http://localhost:8900/v1 python batchScoring.py submit
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from email.message import Message
+from email.parser import BytesParser
+from typing import cast
+
+from fastapi import FastAPI, HTTPException, Request, Response
+
+MOCK_BATCH_DELAY: float = float(os.getenv("MOCK_BATCH_DELAY", "5"))
+
+app = FastAPI()
+_files: dict[str, dict] = {}
+_batches: dict[str, dict] = {}
+
+
+def _file_object(file_id: str) -> dict:
+    f = _files[file_id]
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(f["content"]),
+        "created_at": f["created_at"],
+        "filename": f["filename"],
+        "purpose": f["purpose"],
+        "status": "processed",
+    }
+
+
+def _fake_completion(custom_id: str, body: dict) -> dict:
+    user_msg = body["messages"][-1]["content"]
+    score = int(hashlib.sha256(user_msg.encode()).hexdigest(), 16) % 10
+    content = json.dumps({"summary": f"Mock summary for article {custom_id}.", "score": score})
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": custom_id,
+        "response": {
+            "status_code": 200,
+            "request_id": uuid.uuid4().hex,
+            "body": {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(user_msg) // 4, "completion_tokens": 60,
+                          "total_tokens": len(user_msg) // 4 + 60},
+            },
+        },
+        "error": None,
+    }
+
+
+def _finish(batch: dict) -> None:
+    lines = _files[batch["input_file_id"]]["content"].decode().splitlines()
+    requests = [json.loads(line) for line in lines if line.strip()]
+    output = "\n".join(json.dumps(_fake_completion(r["custom_id"], r["body"])) for r in requests) + "\n"
+    output_id = f"file-{uuid.uuid4().hex}"
+    _files[output_id] = {"content": output.encode(), "created_at": int(time.time()),
+                         "filename": "output.jsonl", "purpose": "batch_output"}
+    batch.update(
+        status="completed",
+        output_file_id=output_id,
+        completed_at=int(time.time()),
+        request_counts={"total": len(requests), "completed": len(requests), "failed": 0},
+    )
+
+
+@app.post("/v1/files")
+async def upload_file(request: Request):
+    # Parse the multipart body with the stdlib so the mock needs no extra dependency.
+    header = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+    message = BytesParser().parsebytes(header + await request.body())
+    if not message.is_multipart():
+        raise HTTPException(status_code=400, detail="expected a multipart/form-data body")
+    parts = cast(list[Message], message.get_payload())
+    fields = {part.get_param("name", header="content-disposition"): part for part in parts}
+    if "file" not in fields:
+        raise HTTPException(status_code=400, detail="missing file")
+    file_id = f"file-{uuid.uuid4().hex}"
+    _files[file_id] = {
+        "content": fields["file"].get_payload(decode=True),
+        "created_at": int(time.time()),
+        "filename": fields["file"].get_filename() or "upload.jsonl",
+        "purpose": fields["purpose"].get_payload() if "purpose" in fields else "batch",
+    }
+    return _file_object(file_id)
+
+
+@app.get("/v1/files/{file_id}/content")
+def file_content(file_id: str):
+    if file_id not in _files:
+        raise HTTPException(status_code=404, detail="file not found")
+    return Response(content=_files[file_id]["content"], media_type="application/jsonl")
+
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    params = await request.json()
+    if params.get("input_file_id") not in _files:
+        raise HTTPException(status_code=400, detail="unknown input_file_id")
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    _batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": params["endpoint"],
+        "input_file_id": params["input_file_id"],
+        "completion_window": params.get("completion_window", "24h"),
+        "status": "in_progress",
+        "created_at": int(time.time()),
+        "output_file_id": None,
+        "error_file_id": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+    return _batches[batch_id]
+
+
+@app.get("/v1/batches/{batch_id}")
+def get_batch(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="batch not found")
+    if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= MOCK_BATCH_DELAY:
+        _finish(batch)
+    return batch
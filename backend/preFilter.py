@@ -0,0 +1,279 @@
+"""
+Local relevance pre-filter in front of the LLM.
+
+Most articles of a source get a low score anyway (sports, crime, ... that
+the preference says to ignore). This module learns, per preference, a cheap
+TF-IDF model from the articles the LLM has already scored and gives new
+articles a provisional score. Articles predicted below PREFILTER_THRESHOLD
+keep that provisional score (articles.provisional = 1) and skip the LLM.
+
+The model, per preference:
+  - articles are hashed TF-IDF vectors (words of title + text, _DIMENSIONS
+    buckets, IDF from the training rows), computed with NumPy,
+  - features are the cosine similarity to the centroid of relevant
+    (score >= PREFILTER_RELEVANT) and of irrelevant training articles, and to
+    the preference text itself,
+  - a least-squares fit maps the features to the LLM score.
+A fifth of the rows is held out to measure agreement with the LLM. A
+preference is only filtered once it has PREFILTER_MIN_SAMPLES scored rows and
+at most PREFILTER_MAX_MISS of its held-out relevant articles would have been
+skipped. PREFILTER_AUDIT of the articles that would be skipped still go to
+the LLM, which keeps measuring agreement on live traffic (see stats()).
+"""
+import logging
+import math
+import os
+import random
+import threading
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+import db
+from config import get_preference
+from helper import dataArticle, normalize_text
+
+logger = logging.getLogger(__name__)
+
+PREFILTER_THRESHOLD: float = float(os.getenv("PREFILTER_THRESHOLD", "2"))  # 0 disables the pre-filter
+PREFILTER_RELEVANT: int = int(os.getenv("PREFILTER_RELEVANT", "5"))
+PREFILTER_MIN_SAMPLES: int = int(os.getenv("PREFILTER_MIN_SAMPLES", "200"))
+PREFILTER_MAX_MISS: float = float(os.getenv("PREFILTER_MAX_MISS", "0.05"))
+PREFILTER_AUDIT: float = float(os.getenv("PREFILTER_AUDIT", "0.05"))
+PREFILTER_TRAIN_ROWS: int = int(os.getenv("PREFILTER_TRAIN_ROWS", "20000"))
+
+_DIMENSIONS = 1 << 16
+_TEXT_CHARS = 3000
+_HOLDOUT = 0.2
+_MIN_WORD_LENGTH = 3
+_MAX_PENDING_AUDITS = 10000  # audited articles waiting for their LLM score
+
+
+def _bucket_counts(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Hashed bag of words: (bucket indices, counts)."""
+    words = [w for w in normalize_text(text).split() if len(w) >= _MIN_WORD_LENGTH]
+    hashes = np.fromiter((zlib.crc32(w.encode()) for w in words), dtype=np.uint32, count=len(words))
+    return np.unique(hashes % _DIMENSIONS, return_counts=True)
+
+
+def _document(article_title: str | None, article_text: str | None) -> str:
+    # The title counts twice; it's the densest part of an article.
+    title = article_title or ""
+    return f"{title}\n{title}\n{(article_text or '')[:_TEXT_CHARS]}"
+
+
+@dataclass
+class _Profile:
+    """Model for one preference."""
+    relevant: np.ndarray        # unit-length centroids
+    irrelevant: np.ndarray
+    preference: np.ndarray
+    weights: np.ndarray         # intercept + one weight per feature
+    sources: list[str]
+    samples: int
+    enabled: bool
+    evaluation: dict
+
+
+class _Model:
+    def __init__(self, idf: np.ndarray, profiles: dict[str, _Profile]):
+        self.idf = idf
+        self.profiles = profiles
+
+    def vector(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """Sparse unit TF-IDF vector (indices, values)."""
+        return _tfidf(_bucket_counts(text), self.idf)
+
+
+def _tfidf(counts: tuple[np.ndarray, np.ndarray], idf: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    idx, tf = counts
+    values = (1 + np.log(tf)) * idf[idx]
+    norm = np.linalg.norm(values)
+    return idx, values / norm if norm else values
+
+
+def _unit(dense: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(dense)
+    return dense / norm if norm else dense
+
+
+def _features(vectors: list[tuple[np.ndarray, np.ndarray]], profile: _Profile) -> np.ndarray:
+    x = np.ones((len(vectors), 4))
+    for row, (idx, values) in enumerate(vectors):
+        x[row, 1] = values @ profile.relevant[idx]
+        x[row, 2] = values @ profile.irrelevant[idx]
+        x[row, 3] = values @ profile.preference[idx]
+    return x
+
+
+def _centroid(vectors: list[tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    dense = np.zeros(_DIMENSIONS)
+    for idx, values in vectors:
+        dense[idx] += values
+    return _unit(dense)
+
+
+def _evaluate(predicted: np.ndarray, actual: np.ndarray, threshold: float) -> dict:
+    """Agreement of provisional scores with LLM scores."""
+    skipped = predicted < threshold
+    relevant = actual >= PREFILTER_RELEVANT
+    agree = skipped != relevant  # skipped exactly the articles the LLM didn't find relevant
+    correlation = float(np.corrcoef(predicted, actual)[0, 1]) if len(actual) > 1 and actual.std() and predicted.std() else 0.0
+    return {
+        "samples": int(len(actual)),
+        "mae": round(float(np.abs(predicted - actual).mean()), 2) if len(actual) else None,
+        "correlation": round(correlation, 3),
+        "agreement": round(float(agree.mean()), 3) if len(actual) else None,
+        "skip_rate": round(float(skipped.mean()), 3) if len(actual) else None,
+        "missed_relevant": round(float((skipped & relevant).sum() / relevant.sum()), 3) if relevant.any() else 0.0,
+    }
+
+
+def train(rows: list[dict], threshold: float = PREFILTER_THRESHOLD, seed: int = 0) -> _Model:
+    """Build the model from LLM-scored rows (site_name, title, text, score)."""
+    counts = [_bucket_counts(_document(row["title"], row["text"])) for row in rows]
+    df = np.zeros(_DIMENSIONS)
+    for idx, _ in counts:
+        df[idx] += 1
+    idf = np.log((1 + len(rows)) / (1 + df)) + 1
+
+    by_preference: dict[str, list[int]] = {}
+    for i, row in enumerate(rows):
+        preference = get_preference(row["site_name"])
+        if preference is not None:
+            by_preference.setdefault(preference, []).append(i)
+
+    rng = random.Random(seed)
+    profiles: dict[str, _Profile] = {}
+    for preference, members in by_preference.items():
+        rng.shuffle(members)
+        holdout = members[:int(len(members) * _HOLDOUT)]
+        train_rows = members[len(holdout):]
+        vectors = {i: _tfidf(counts[i], idf) for i in members}
+        scores = np.array([rows[i]["score"] for i in members], dtype=float)
+        train_scores = scores[len(holdout):]
+        relevant = [vectors[i] for i, s in zip(train_rows, train_scores) if s >= PREFILTER_RELEVANT]
+        irrelevant = [vectors[i] for i, s in zip(train_rows, train_scores) if s < PREFILTER_RELEVANT]
+
+        pref_idx, pref_values = _tfidf(_bucket_counts(preference), idf)
+        pref_dense = np.zeros(_DIMENSIONS)
+        pref_dense[pref_idx] = pref_values
+        profile = _Profile(
+            relevant=_centroid(relevant),
+            irrelevant=_centroid(irrelevant),
+            preference=pref_dense,
+            weights=np.zeros(4),
+            sources=sorted({rows[i]["site_name"] for i in members}),
+            samples=len(members),
+            enabled=False,
+            evaluation={},
+        )
+        if train_rows:
+            profile.weights = np.linalg.lstsq(_features([vectors[i] for i in train_rows], profile),
+                                              train_scores, rcond=None)[0]
+        if holdout:
+            predicted = _features([vectors[i] for i in holdout], profile) @ profile.weights
+            profile.evaluation = _evaluate(predicted, scores[:len(holdout)], threshold)
+        profile.enabled = (
+            len(members) >= PREFILTER_MIN_SAMPLES
+            and bool(relevant) and bool(irrelevant)
+            and profile.evaluation.get("missed_relevant", 1.0) <= PREFILTER_MAX_MISS
+        )
+        profiles[preference] = profile
+    return _Model(idf, profiles)
+
+
+class PreFilter:
+    def __init__(self, threshold: float = PREFILTER_THRESHOLD, audit: float = PREFILTER_AUDIT):
+        self._threshold = threshold
+        self._audit = audit
+        self._model: _Model | None = None
+        self._lock = threading.Lock()
+        self._audits: dict[int, float] = {}   # article id -> provisional score, for audited articles
+        self.skipped = 0
+        self.forwarded = 0
+        self._audit_results: list[tuple[float, int]] = []  # (provisional, LLM score)
+
+    @property
+    def enabled(self) -> bool:
+        return self._threshold > 0
+
+    def retrain(self) -> None:
+        """Rebuild the model from the newest LLM scores. Blocking; run it in a worker thread."""
+        if not self.enabled:
+            return
+        rows = db.get_training_rows(PREFILTER_TRAIN_ROWS, _TEXT_CHARS)
+        model = train(rows, self._threshold)
+        self._model = model
+        active = sum(1 for p in model.profiles.values() if p.enabled)
+        logger.info(f"Pre-filter trained on {len(rows)} scored articles, active for {active}/{len(model.profiles)} preferences")
+
+    def split(self, articles: list[dataArticle]) -> tuple[list[dataArticle], dict[int, int]]:
+        """
+        Return (articles to send to the LLM, {article id: provisional score} for
+        the rest). CPU-bound; run it in a worker thread.
+        """
+        model = self._model
+        if model is None:
+            return articles, {}
+        forward: list[dataArticle] = []
+        provisional: dict[int, int] = {}
+        for article in articles:
+            preference = get_preference(article.site_name)
+            profile = model.profiles.get(preference) if preference is not None else None
+            if profile is None or not profile.enabled:
+                forward.append(article)
+                continue
+            vector = model.vector(_document(article.title, article.text))
+            predicted = float(_features([vector], profile)[0] @ profile.weights)
+            if predicted >= self._threshold:
+                forward.append(article)
+            elif random.random() < self._audit:
+                with self._lock:
+                    self._audits[article.id] = predicted
+                    if len(self._audits) > _MAX_PENDING_AUDITS:
+                        del self._audits[next(iter(self._audits))]
+                forward.append(article)
+            else:
+                provisional[article.id] = min(9, max(0, math.floor(predicted)))
+        with self._lock:
+            self.skipped += len(provisional)
+            self.forwarded += len(forward)
+        return forward, provisional
+
+    def observe(self, article_id: int, score: int) -> None:
+        """Record the LLM score of an audited article."""
+        with self._lock:
+            predicted = self._audits.pop(article_id, None)
+            if predicted is not None:
+                self._audit_results.append((predicted, score))
+                del self._audit_results[:-1000]
+
+    def discard(self, article_ids: list[int]) -> None:
+        """Forget audited articles whose scoring failed."""
+        with self._lock:
+            for article_id in article_ids:
+                self._audits.pop(article_id, None)
+
+    def stats(self) -> dict:
+        model = self._model
+        with self._lock:
+            audit = list(self._audit_results)
+        total = self.skipped + self.forwarded
+        return {
+            "threshold": self._threshold,
+            "trained": model is not None,
+            "skipped": self.skipped,
+            "forwarded": self.forwarded,
+            "skip_rate": round(self.skipped / total, 3) if total else 0.0,
+            "audit": _evaluate(np.array([p for p, _ in audit]), np.array([s for _, s in audit], dtype=float),
+                               self._threshold) if audit else None,
+            "preferences": {
+                ", ".join(p.sources): {"samples": p.samples, "enabled": p.enabled, "holdout": p.evaluation}
+                for p in (model.profiles.values() if model else ())
+            },
+        }
+
+
+pre_filter = PreFilter()
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+except ImportError:
+    orjson = None
+try:
+    import brotli  # pyright: ignore[reportMissingImports]
+except ImportError:
+    brotli = None
+
+RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_TTL: float = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+COMPRESS_MIN_BYTES: int = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+
+
+def dumps(payload) -> bytes:
+    """Serialise a response payload (dicts, lists, dataclasses, datetimes) to JSON."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(jsonable_encoder(payload)).encode()
+
+
+def _accepted(accept_encoding: str | None) -> set[str]:
+    codings = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.partition(";")
+        q = params.strip()
+        try:
+            if q.startswith("q=") and float(q[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        if name.strip():
+            codings.add(name.strip().lower())
+    return codings
+
+
+class CachedBody:
+    """
+    A serialised response body with its strong ETag (a digest of the body)
+    and lazily built, memoised gzip / brotli variants.
+    """
+
+    def __init__(self, body: bytes, version: int):
+        self.body = body
+        self.version = version
+        self.created = time.monotonic()
+        self.etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        self._encoded: dict[str, bytes] = {}
+
+    def encoded(self, accept_encoding: str | None) -> tuple[bytes, str | None, str]:
+        """Return (body, content-encoding or None, etag) for the client's Accept-Encoding."""
+        if len(self.body) < COMPRESS_MIN_BYTES:
+            return self.body, None, self.etag
+        accepted = _accepted(accept_encoding)
+        if brotli is not None and "br" in accepted:
+            coding = "br"
+        elif "gzip" in accepted:
+            coding = "gzip"
+        else:
+            return self.body, None, self.etag
+        data = self._encoded.get(coding)
+        if data is None:
+            if coding == "br":
+                data = brotli.compress(self.body, quality=_BROTLI_QUALITY)  # pyright: ignore[reportOptionalMemberAccess]
+            else:
+                data = gzip.compress(self.body, compresslevel=_GZIP_LEVEL, mtime=0)
+            self._encoded[coding] = data
+        # Each content-coding is a different representation, so it gets its own strong ETag.
+        return data, coding, f'{self.etag[:-1]}-{coding}"'
+
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in list(self._encoded.values()))
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 prescribes for it)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    Thread-safe TTL + LRU cache of pre-serialised response bodies.
+
+    Every entry remembers the data version it was built from (see
+    db.data_version). An entry is only served while that version is still
+    current and it is younger than the TTL; the TTL bounds staleness caused by
+    writes from other replicas, which don't bump our local version. While an
+    entry is valid, its ETag is current too, so conditional requests can be
+    answered with 304 without touching the database.
+    """
+
+    def __init__(self, version: Callable[[], int], max_size: int = RESPONSE_CACHE_SIZE,
+                 ttl: float = RESPONSE_CACHE_TTL):
+        self._version = version
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: OrderedDict[tuple, CachedBody] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> CachedBody | None:
+        version = self._version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version and now - entry.created < self._ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, body: bytes, version: int) -> CachedBody:
+        """Store body, built from data at `version` (read it *before* querying)."""
+        entry = CachedBody(body, version)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "ttl_seconds": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": sum(e.size() for e in self._entries.values()),
+            }
@@ -8,15 +8,6 @@ from llmRelevance import async_estimate, AsyncRateLimiter
 
 RATE_LIMIT = 15  # requests per minute
 
-# 1. Scrape the first site from config
-first_name, first_url = get_all_urls()[0]
-#print(f"Scraping {first_name} ({first_url})...")
-scrape(first_name, first_url)
-
-# 2. Get all stored articles
-articles = get_articles_by_url(first_url)
-print(f"Scoring {len(articles)} articles...\n")
-
 
 async def main():
     rate_limiter = AsyncRateLimiter(RATE_LIMIT)
@@ -42,4 +33,15 @@ async def main():
         print(f"[{score}] {title}\n    {summary}\n    {url}\n")
 
 
-asyncio.run(main())
\ No newline at end of file
+# Article parsing runs in spawned worker processes, which re-import __main__.
+if __name__ == "__main__":
+    # 1. Scrape the first site from config
+    first_name, first_url = get_all_urls()[0]
+    #print(f"Scraping {first_name} ({first_url})...")
+    scrape(first_name, first_url)
+
+    # 2. Get all stored articles
+    articles = get_articles_by_url(first_url)
+    print(f"Scoring {len(articles)} articles...\n")
+
+    asyncio.run(main())
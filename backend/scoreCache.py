@@ -0,0 +1,119 @@
+"""
+Persistent cache of LLM relevance results, keyed by content.
+
+Syndicated stories show up under several sources and URLs, and re-ingested
+articles get scored again; both produce the same prompt. The cache key is a
+hash of (model, preference, language, normalised title + text), so such
+articles reuse the stored (score, summary) instead of calling the API.
+Entries live in the score_cache table; the least recently used ones are
+evicted once it holds more than SCORE_CACHE_MAX entries.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+import db
+from config import get_language, get_preference
+from helper import dataArticle, normalize_text
+
+logger = logging.getLogger(__name__)
+
+SCORE_CACHE_MAX: int = int(os.getenv("SCORE_CACHE_MAX", "100000"))  # 0 disables the cache
+
+# Prune after this many new entries rather than on every store.
+_PRUNE_EVERY = 1000
+
+
+def cache_key(model: str, article: dataArticle) -> str | None:
+    """Content-hash key for an article's scoring request (None if the source isn't scored)."""
+    preference = get_preference(article.site_name)
+    if preference is None:
+        return None
+    language = get_language(article.site_name) or "English"
+    content = normalize_text(f"{article.title or ''}\n{article.text or ''}")
+    raw = json.dumps([model, preference, language, content], ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ScoreCache:
+    def __init__(self, max_entries: int = SCORE_CACHE_MAX):
+        self._max_entries = max_entries
+        self._since_prune = 0
+        self._per_source: dict[str, list[int]] = {}  # site_name -> [hits, misses]
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0
+
+    async def lookup(self, model: str, articles: list[dataArticle]) -> dict[int, tuple[int, str]]:
+        """Return {article id: (score, summary)} for the articles with a cached result."""
+        if not self.enabled:
+            return {}
+        keys = {article.id: cache_key(model, article) for article in articles}
+        try:
+            found = await asyncio.to_thread(db.get_cached_scores, [k for k in keys.values() if k])
+        except Exception as e:
+            # The cache only saves calls; without it the articles go to the LLM.
+            self.errors += 1
+            logger.warning(f"Score cache lookup failed, scoring {len(articles)} articles without it: {e}")
+            return {}
+        results: dict[int, tuple[int, str]] = {}
+        for article in articles:
+            key = keys[article.id]
+            if key is None:
+                continue
+            counts = self._per_source.setdefault(article.site_name, [0, 0])
+            if key in found:
+                score, summary = found[key]
+                results[article.id] = (score, summary or "")
+                counts[0] += 1
+            else:
+                counts[1] += 1
+        return results
+
+    async def store(self, model: str, articles: list[dataArticle], results: dict[int, tuple[int, str]]) -> None:
+        """Remember the results of freshly scored articles."""
+        if not self.enabled:
+            return
+        entries = []
+        for article in articles:
+            key = cache_key(model, article)
+            if key is not None and article.id in results:
+                entries.append((key, *results[article.id]))
+        if not entries:
+            return
+        try:
+            await asyncio.to_thread(db.save_cached_scores, entries)
+            self._since_prune += len(entries)
+            if self._since_prune >= _PRUNE_EVERY:
+                self._since_prune = 0
+                evicted = await asyncio.to_thread(db.prune_score_cache, self._max_entries)
+                if evicted:
+                    logger.info(f"Evicted {evicted} entries from the score cache")
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Failed to store {len(entries)} results in the score cache: {e}")
+
+    def stats(self) -> dict:
+        def rate(hits: int, misses: int) -> float:
+            return round(hits / (hits + misses), 3) if hits + misses else 0.0
+
+        hits = sum(c[0] for c in self._per_source.values())
+        misses = sum(c[1] for c in self._per_source.values())
+        return {
+            "max_entries": self._max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": rate(hits, misses),
+            "errors": self.errors,
+            "sources": {
+                name: {"hits": h, "misses": m, "hit_rate": rate(h, m)}
+                for name, (h, m) in sorted(self._per_source.items())
+            },
+        }
+
+
+score_cache = ScoreCache()
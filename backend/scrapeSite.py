@@ -1,23 +1,192 @@
+import asyncio
+import hashlib
 import logging
+import threading
 
+import feedparser
+import httpx
 import newspaper
 from newspaper.source import Feed
 from newspaper.google_news import GoogleNewsSource
 import config
-from db import get_stored_urls, save_article
+import metrics
+from db import find_existing_url_keys, get_feed_states, save_articles, save_feed_states
+from articleParser import parse_pages
+from fetcher import fetcher
+from helper import canonical_url
 
 logger = logging.getLogger(__name__)
 
-def scrape(site_name: str) -> None:
+STAGE_SECONDS = metrics.Histogram(
+    "scrape_stage_duration_seconds",
+    "Time spent per scrape stage (feeds, build, download, parse, save) and source.",
+    ("source", "stage"),
+)
+DOWNLOADED_BYTES = metrics.Counter(
+    "scrape_downloaded_bytes_total", "Bytes downloaded per source, feeds and article pages.", ("source", "kind"),
+)
+ARTICLES = metrics.Counter(
+    "scrape_articles_total",
+    "Articles per source and outcome (downloaded, download_failed, parsed, saved).",
+    ("source", "outcome"),
+)
+
+# Per-source conditional-fetch counters since process start (see feed_stats()).
+_feed_counters: dict[str, dict[str, int]] = {}
+_feed_counters_lock = threading.Lock()
+
+
+def _count(site_name: str, key: str, n: int = 1) -> None:
+    with _feed_counters_lock:
+        counters = _feed_counters.setdefault(site_name, {})
+        counters[key] = counters.get(key, 0) + n
+
+
+def feed_stats() -> dict[str, dict[str, int]]:
+    """Return per-source feed counters: requests, not_modified (304s), unchanged,
+    errors, bytes_downloaded and bytes_saved (estimated from the last full body)."""
+    with _feed_counters_lock:
+        return {name: dict(counters) for name, counters in _feed_counters.items()}
+
+
+def _feed_items(rss: str) -> list[tuple[str, str | None]]:
+    """(item id, link) of every feed entry; the id falls back to the link."""
+    entries = feedparser.parse(rss).entries
+    return [(e.get("id") or e.get("link"), e.get("link")) for e in entries if e.get("id") or e.get("link")]
+
+
+async def _download_feeds(site_name: str, feed_urls: list[str], news_config: newspaper.Config) -> tuple[list[Feed], list[dict]]:
+    """
+    Download the site's RSS feeds using conditional GET (ETag / Last-Modified).
+    Returns the feeds that carry new items, plus the feed_state rows to persist
+    once those items have been processed. Feeds that answer 304, or whose body
+    or item ids haven't changed since the last run, are dropped.
+    """
+    states = await asyncio.to_thread(get_feed_states, feed_urls)
+
+    async def fetch(feed_url: str) -> httpx.Response | None:
+        prev = states.get(feed_url, {})
+        headers = dict(news_config.headers or {})
+        if prev.get("etag"):
+            headers["If-None-Match"] = prev["etag"]
+        if prev.get("last_modified"):
+            headers["If-Modified-Since"] = prev["last_modified"]
+        _count(site_name, "requests")
+        return await fetcher.get(feed_url, headers=headers)
+
+    responses = await asyncio.gather(*(fetch(feed_url) for feed_url in feed_urls))
+
+    feeds: list[Feed] = []
+    updates: list[dict] = []
+    for feed_url, response in zip(feed_urls, responses):
+        prev = states.get(feed_url, {})
+        if response is None:
+            logger.warning(f"Error downloading feed {feed_url}")
+            _count(site_name, "errors")
+            continue
+        if response.status_code == 304:
+            _count(site_name, "not_modified")
+            _count(site_name, "bytes_saved", prev.get("content_length") or 0)
+            continue
+        if response.status_code >= 400:
+            logger.warning(f"Feed {feed_url} returned HTTP {response.status_code}")
+            _count(site_name, "errors")
+            continue
+
+        body = response.content
+        _count(site_name, "bytes_downloaded", len(body))
+        DOWNLOADED_BYTES.inc(len(body), source=site_name, kind="feed")
+        content_hash = hashlib.sha256(body).hexdigest()
+        items = _feed_items(response.text)
+        item_ids = [item_id for item_id, _ in items]
+        updates.append({
+            "feed_url": feed_url,
+            "site_name": site_name,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+            "content_length": len(body),
+            "item_ids": item_ids,
+            "item_links": {canonical_url(link): item_id for item_id, link in items if link},
+        })
+        if content_hash == prev.get("content_hash") or (
+            item_ids and set(item_ids) <= set(prev.get("item_ids", []))
+        ):
+            _count(site_name, "unchanged")
+            continue
+        feeds.append(Feed(url=feed_url, rss=response.text))
+    return feeds, updates
+
+
+def _without_retries(updates: list[dict], retry: set[str]) -> list[dict]:
+    """
+    Leave the items whose article download failed transiently (canonical URLs
+    in `retry`) out of the feed state, and forget the validators of their feeds,
+    so the next run downloads those feeds again and retries the articles.
+    """
+    states = []
+    for update in updates:
+        links = update.get("item_links", {})
+        failed = {links[key] for key in retry if key in links}
+        if failed:
+            update = {
+                **update,
+                "etag": None,
+                "last_modified": None,
+                "content_hash": None,
+                "item_ids": [item_id for item_id in update["item_ids"] if item_id not in failed],
+            }
+        states.append(update)
+    return states
+
+
+async def _download_articles(site_name: str, articles: list[newspaper.Article],
+                             news_config: newspaper.Config) -> tuple[list[tuple[str, bytes, str | None]], list[str]]:
+    """
+    Fetch article HTML through the shared fetcher. Returns (url, html, encoding)
+    for successful downloads, and the URLs that failed transiently (connection
+    errors, 429 / 5xx after all retries) and are worth retrying later.
+    """
+    headers = dict(news_config.headers or {})
+    responses = await asyncio.gather(*(fetcher.get(article.url, headers=headers) for article in articles))
+    downloaded = []
+    failed = []
+    retry = []
+    for article, response in zip(articles, responses):
+        if response is None or response.status_code >= 400:
+            failed.append(article.url)
+            if response is None:
+                retry.append(article.url)
+            continue
+        downloaded.append((article.url, response.content, response.charset_encoding))
+        DOWNLOADED_BYTES.inc(len(response.content), source=site_name, kind="article")
+    ARTICLES.inc(len(downloaded), source=site_name, outcome="downloaded")
+    ARTICLES.inc(len(failed), source=site_name, outcome="download_failed")
+    if failed:
+        logger.warning(f"{len(failed)} articles of {site_name} failed to download: {', '.join(failed)}")
+    return downloaded, retry
+
+
+def _build_google_source(google: str, news_config: newspaper.Config) -> GoogleNewsSource:
+    source = GoogleNewsSource(period="3h", max_results=50)
+    source.build(site=google)
+    source.config = news_config
+    return source
+
+
+async def scrape(site_name: str) -> list[int]:
     """
     Scrape articles from the given URL and save them to the database
-    if not already processed. Uses Newspaper4k bulk download.
+    if not already processed. Feeds and article pages are downloaded through
+    the shared async fetcher and parsed in the articleParser process pool;
+    Newspaper4k itself only builds the source.
+    Returns the ids of the newly inserted articles.
     """
 
     url = config.get_url(site_name)
     if not url:
         logger.error(f"No URL found for site '{site_name}' in config.")
-        return
+        return []
     rss = config.get_rss(site_name)
     google = config.get_google(site_name)
     logging.info(f"Scraping {site_name} using {"rss" if rss else "google" if google else "crawler"}...")
@@ -28,60 +197,63 @@ def scrape(site_name: str) -> None:
     news_config.http_success_only = True
     news_config.min_word_count = 250
 
+    feed_updates: list[dict] = []
     try:
         if google:
-            source = GoogleNewsSource(period="3h", max_results=50)
-            source.build(site=google)
-            source.config = news_config
+            with metrics.span(STAGE_SECONDS, "scrape.build", source=site_name, stage="build"):
+                source = await asyncio.to_thread(_build_google_source, google, news_config)
+        elif rss is not None:
+            source = newspaper.build("https://"+url, config=news_config, dry=True)
+            with metrics.span(STAGE_SECONDS, "scrape.feeds", source=site_name, stage="feeds"):
+                source.feeds, feed_updates = await _download_feeds(site_name, rss, news_config)
+            if not source.feeds:
+                await asyncio.to_thread(save_feed_states, feed_updates)
+                logger.info(f"Feeds of {site_name} unchanged since last run, skipping.")
+                return []
+            source.generate_articles()
         else:
-            source = newspaper.build("https://"+url, config=news_config,  dry=(rss is not None))
-            if rss is not None:
-                source.feeds = [Feed(url=url) for url in rss]
-                tmp = source.download_feeds()
-                source.generate_articles()
+            with metrics.span(STAGE_SECONDS, "scrape.build", source=site_name, stage="build"):
+                source = await asyncio.to_thread(newspaper.build, "https://"+url, config=news_config)
     except Exception as e:
         logger.error(f"Error building newspaper source for {url}: {e}")
-        return
+        return []
 
     #Filtering
     filter = set(config.get_filter(site_name) or [""])
-    stored = set(get_stored_urls(url))
     articles = [article for article in source.articles]
+    candidates: dict[str, newspaper.Article] = {}
+    for article in articles:
+        if any(keyword in article.url for keyword in filter) and (url in article.url):
+            candidates.setdefault(canonical_url(article.url), article)
+    stored = await asyncio.to_thread(find_existing_url_keys, list(candidates))
     articles_to_download = [
-        article for article in articles
-        if any(keyword in article.url for keyword in filter)
-        and (url in article.url)
-        and article.url not in stored
+        article for key, article in candidates.items()
+        if key not in stored
     ]
     logger.info(f"Found {len(articles)} articles for {site_name}, {len(articles_to_download)} to download after filtering and deduplication.")
     if articles_to_download is None or len(articles_to_download) == 0:
-        return
-    source.articles = articles_to_download
+        await asyncio.to_thread(save_feed_states, feed_updates)
+        return []
 
-    # Downloading
+    # Downloading, then parsing in the process pool. Google News results skip
+    # newspaper's body validation, as before.
     try:
-        source.download_articles()
-        if not google:
-            source.parse_articles()
-        else:
-            for article in source.articles: 
-                article.parse()
+        with metrics.span(STAGE_SECONDS, "scrape.download", source=site_name, stage="download"):
+            downloaded, retry = await _download_articles(site_name, articles_to_download, news_config)
+        with metrics.span(STAGE_SECONDS, "scrape.parse", source=site_name, stage="parse"):
+            parsed = await parse_pages(downloaded, news_config.min_word_count, validate=not google)
+        ARTICLES.inc(len(parsed), source=site_name, outcome="parsed")
     except Exception as e:
         logger.error(f"Error downloading/parsing articles from {url}: {e}")
-        return
+        return []
+
+    with metrics.span(STAGE_SECONDS, "scrape.save", source=site_name, stage="save"):
+        inserted = await asyncio.to_thread(save_articles, [
+            {"site_name": site_name, **record} for record in parsed
+        ])
+    ARTICLES.inc(len(inserted), source=site_name, outcome="saved")
+
+    await asyncio.to_thread(save_feed_states, _without_retries(feed_updates, {canonical_url(u) for u in retry}))
+    logging.info(f"Finished scraping {site_name}. {len(inserted)} articles downloaded.")
+    return inserted
 
-    counter = 0
-    for article in source.articles:
-        if not article.is_parsed or not article.text:
-            continue
-        save_article(
-            site_name=site_name,
-            url=article.url,
-            title=article.title,
-            text=article.text,
-            authors=article.authors,
-            publish_date=article.publish_date,
-        )
-        counter += 1
-    
-    logging.info(f"Finished scraping {site_name}. {counter} articles downloaded.")
\ No newline at end of file
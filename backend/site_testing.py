@@ -1,8 +1,11 @@
 import logging
-logging.basicConfig(level=logging.DEBUG, force=True)
-
+import asyncio
 import scrapeSite
-scrapeSite.scrape("AP News")
+
+# Article parsing runs in spawned worker processes, which re-import __main__.
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, force=True)
+    asyncio.run(scrapeSite.scrape("AP News"))
 
 """
 import newspaper
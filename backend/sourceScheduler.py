@@ -0,0 +1,191 @@
+"""
+Per-source scrape scheduler.
+
+Every configured source gets its own timer instead of being fired together
+with all other sources of its kind. A single dispatcher tick (run by
+APScheduler every SCRAPE_TICK_SECONDS) starts the sources that are due:
+  - each source has a base interval: `interval` (minutes) in sources.yaml,
+    otherwise 10 min for RSS, 30 min for Google News and 60 min for crawling,
+  - a run that yields no new articles doubles the source's interval, up to
+    SCRAPE_MAX_BACKOFF times the base; a run with new articles resets it,
+  - every delay is jittered by +/- SCRAPE_JITTER so sources drift apart,
+  - at most SCRAPE_MAX_IN_FLIGHT scrapes (SCRAPE_MAX_GOOGLE for Google News)
+    run at once; due sources beyond that wait for the next tick,
+  - a source still running when it becomes due again is skipped, not stacked.
+Sources added to or removed from sources.yaml are picked up on the next tick.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SCRAPE_TICK_SECONDS: int = int(os.getenv("SCRAPE_TICK_SECONDS", "15"))
+SCRAPE_MAX_IN_FLIGHT: int = int(os.getenv("SCRAPE_MAX_IN_FLIGHT", "4"))
+SCRAPE_MAX_GOOGLE: int = int(os.getenv("SCRAPE_MAX_GOOGLE", "1"))
+SCRAPE_MAX_BACKOFF: float = float(os.getenv("SCRAPE_MAX_BACKOFF", "6"))
+SCRAPE_JITTER: float = float(os.getenv("SCRAPE_JITTER", "0.1"))
+SCRAPE_START_DELAY: float = float(os.getenv("SCRAPE_START_DELAY", "60"))
+
+RUN_SECONDS = metrics.Histogram("scrape_run_duration_seconds", "Duration of whole scrape runs per source.", ("source",))
+SKIPPED = metrics.Counter(
+    "scrape_skipped_total", "Scrape slots skipped because the previous run of the source was still going.", ("source",),
+)
+
+# Default interval in minutes per source kind, used when a source sets none.
+DEFAULT_INTERVALS = {"rss": 10.0, "google": 30.0, "crawl": 60.0}
+# First runs after startup are spread over at most this many seconds.
+_STARTUP_SPREAD = 600.0
+
+
+def source_kind(source: config.SourceConfig) -> str:
+    if source.google:
+        return "google"
+    if source.rss:
+        return "rss"
+    return "crawl"
+
+
+class _SourceState:
+    def __init__(self, name: str, kind: str, interval: float, next_run: float):
+        self.name = name
+        self.kind = kind
+        self.interval = interval        # base interval, seconds
+        self.backoff = 1.0              # multiplier applied to the base interval
+        self.next_run = next_run        # time.monotonic() deadline
+        self.running = False
+        self.runs = 0
+        self.skipped = 0                # slots skipped because the previous run was still going
+        self.errors = 0
+        self.last_new: int | None = None
+        self.last_duration: float | None = None
+
+
+class SourceScheduler:
+    """Dispatches scrape(name) per source. tick() must be called from the event loop."""
+
+    def __init__(
+        self,
+        run: Callable[[str], Awaitable[list[int]]],
+        max_in_flight: int = SCRAPE_MAX_IN_FLIGHT,
+        kind_limits: dict[str, int] | None = None,
+        max_backoff: float = SCRAPE_MAX_BACKOFF,
+        jitter: float = SCRAPE_JITTER,
+        start_delay: float = SCRAPE_START_DELAY,
+    ):
+        self._run = run
+        self._max_in_flight = max_in_flight
+        self._kind_limits = kind_limits if kind_limits is not None else {"google": SCRAPE_MAX_GOOGLE}
+        self._max_backoff = max_backoff
+        self._jitter = jitter
+        self._start_delay = start_delay
+        self._sources: dict[str, _SourceState] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * (1 + random.uniform(-self._jitter, self._jitter))
+
+    def _sync_sources(self, now: float) -> None:
+        """Add new sources, drop removed ones and apply interval changes from sources.yaml."""
+        current = {source.name: source for source in config.snapshot().sources}
+        for name in list(self._sources):
+            if name not in current and not self._sources[name].running:
+                del self._sources[name]
+        for name, source in current.items():
+            kind = source_kind(source)
+            interval = (source.interval or DEFAULT_INTERVALS[kind]) * 60
+            state = self._sources.get(name)
+            if state is None:
+                first = now + self._start_delay + random.uniform(0, min(interval, _STARTUP_SPREAD))
+                self._sources[name] = _SourceState(name, kind, interval, first)
+            else:
+                state.kind = kind
+                state.interval = interval
+
+    def _in_flight(self, kind: str | None = None) -> int:
+        return sum(1 for s in self._sources.values() if s.running and (kind is None or s.kind == kind))
+
+    async def tick(self) -> None:
+        """Start every due source that fits within the in-flight limits."""
+        now = time.monotonic()
+        self._sync_sources(now)
+        due = sorted((s for s in self._sources.values() if s.next_run <= now), key=lambda s: s.next_run)
+        in_flight = self._in_flight()
+        for state in due:
+            if state.running:
+                # Skip this slot rather than stacking a second run of the same source.
+                state.skipped += 1
+                SKIPPED.inc(source=state.name)
+                state.next_run += state.interval * state.backoff
+                continue
+            if in_flight >= self._max_in_flight:
+                break
+            limit = self._kind_limits.get(state.kind)
+            if limit is not None and self._in_flight(state.kind) >= limit:
+                continue
+            state.running = True
+            state.next_run = now + state.interval * state.backoff  # provisional; reset when the run ends
+            in_flight += 1
+            task = asyncio.create_task(self._scrape(state), name=f"scrape:{state.name}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _scrape(self, state: _SourceState) -> None:
+        start = time.monotonic()
+        new = 0
+        try:
+            new = len(await self._run(state.name))
+        except Exception as e:
+            state.errors += 1
+            logger.error(f"Scrape of {state.name} failed: {e}")
+        finally:
+            state.running = False
+            state.runs += 1
+            state.last_new = new
+            state.last_duration = time.monotonic() - start
+            RUN_SECONDS.observe(state.last_duration, source=state.name)
+
+        if new:
+            state.backoff = 1.0
+        else:
+            state.backoff = min(state.backoff * 2, self._max_backoff)
+        # Intervals are measured from the start of a run; a run that overran
+        # its slot waits a full interval from now instead.
+        delay = self._jittered(state.interval * state.backoff)
+        now = time.monotonic()
+        state.next_run = start + delay if start + delay > now else now + delay
+        logger.debug(f"{state.name}: {new} new articles, next scrape in {(state.next_run - now) / 60:.1f} min")
+
+    async def aclose(self) -> None:
+        """Cancel running scrapes."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "in_flight": self._in_flight(),
+            "max_in_flight": self._max_in_flight,
+            "sources": {
+                s.name: {
+                    "kind": s.kind,
+                    "interval_minutes": round(s.interval * s.backoff / 60, 1),
+                    "backoff": s.backoff,
+                    "next_run_in_seconds": None if s.running else round(max(0.0, s.next_run - now)),
+                    "running": s.running,
+                    "runs": s.runs,
+                    "skipped": s.skipped,
+                    "errors": s.errors,
+                    "last_new": s.last_new,
+                    "last_duration_seconds": None if s.last_duration is None else round(s.last_duration, 1),
+                }
+                for s in self._sources.values()
+            },
+        }
@@ -0,0 +1,174 @@
+"""
+Near-duplicate story clustering.
+
+Wire copy and syndicated stories show up with small edits (a changed
+headline, an extra paragraph, different boilerplate) under several sources,
+so the exact content hash of the score cache misses them. Every parsed
+article carries a 64-bit SimHash of its title and text (helper.simhash);
+articles whose fingerprints differ in at most CLUSTER_MAX_DISTANCE bits are
+put in the same story cluster.
+
+A cluster is identified by its first article (the representative). Only
+representatives are sent to the LLM; the other members take over the
+representative's score and summary (db.propagate_cluster_scores). Scores and
+summaries depend on the source's preference and language, so clusters are
+kept apart per (preference, language), the same key the score cache uses:
+the same story under a source with another preference is scored on its own.
+Category listings can show one article per cluster with `collapse=true`.
+
+Lookups use in-memory indexes (one per preference and language) of the
+fingerprints of the last CLUSTER_WINDOW_DAYS days. The 64 bits are split into
+CLUSTER_MAX_DISTANCE + 1 bands, so two fingerprints within the distance share
+at least one band exactly and only articles sharing a band are compared.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import db
+from articleEvents import article_events
+from config import get_language, get_preference
+from helper import hamming
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_MAX_DISTANCE: int = int(os.getenv("CLUSTER_MAX_DISTANCE", "6"))
+CLUSTER_WINDOW_DAYS: float = float(os.getenv("CLUSTER_WINDOW_DAYS", "3"))  # 0 disables clustering
+
+
+def _band_masks(bands: int) -> list[tuple[int, int]]:
+    """(shift, mask) per band, splitting 64 bits into `bands` near-equal slices."""
+    masks = []
+    start = 0
+    for i in range(bands):
+        width = 64 // bands + (1 if i < 64 % bands else 0)
+        masks.append((start, (1 << width) - 1))
+        start += width
+    return masks
+
+
+class SimHashIndex:
+    """Fingerprints of recent articles, searchable by Hamming distance. Thread-safe."""
+
+    def __init__(self, max_distance: int = CLUSTER_MAX_DISTANCE):
+        self._max_distance = max_distance
+        self._masks = _band_masks(min(max(max_distance, 0) + 1, 64))
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self) -> None:
+        self._entries: dict[int, tuple[int, int]] = {}  # article id -> (fingerprint, cluster id)
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in self._masks]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _add(self, article_id: int, fp: int, cluster_id: int) -> None:
+        self._entries[article_id] = (fp, cluster_id)
+        for (shift, mask), buckets in zip(self._masks, self._buckets):
+            buckets.setdefault((fp >> shift) & mask, []).append(article_id)
+
+    def _find(self, fp: int) -> int | None:
+        """Cluster id of the earliest indexed article within max_distance of fp."""
+        best: int | None = None
+        for (shift, mask), buckets in zip(self._masks, self._buckets):
+            for candidate in buckets.get((fp >> shift) & mask, ()):
+                if (best is None or candidate < best) and hamming(fp, self._entries[candidate][0]) <= self._max_distance:
+                    best = candidate
+        return None if best is None else self._entries[best][1]
+
+    def load(self, rows: list[tuple[int, int, int | None]]) -> None:
+        """Replace the index with (id, fingerprint, cluster id) rows."""
+        with self._lock:
+            self._clear()
+            for article_id, fp, cluster_id in rows:
+                self._add(article_id, fp, article_id if cluster_id is None else cluster_id)
+
+    def assign(self, rows: list[tuple[int, int, int | None]]) -> dict[int, int]:
+        """Index new (id, fingerprint, cluster id) rows and return {id: cluster id}."""
+        clusters: dict[int, int] = {}
+        with self._lock:
+            for article_id, fp, cluster_id in rows:
+                if article_id in self._entries:
+                    clusters[article_id] = self._entries[article_id][1]
+                    continue
+                if cluster_id is None:
+                    cluster_id = self._find(fp)
+                if cluster_id is None:
+                    cluster_id = article_id
+                self._add(article_id, fp, cluster_id)
+                clusters[article_id] = cluster_id
+        return clusters
+
+
+class StoryClusters:
+    def __init__(self, window_days: float = CLUSTER_WINDOW_DAYS, max_distance: int = CLUSTER_MAX_DISTANCE):
+        self._window = timedelta(days=window_days)
+        self._max_distance = max_distance
+        self._indexes: dict[tuple[str, str], SimHashIndex] = {}
+        self._lock = threading.Lock()
+        self._clustered = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._window > timedelta(0)
+
+    def _group(self, rows: list[tuple[int, str, int, int | None]]) -> dict[tuple[str, str], list[tuple[int, int, int | None]]]:
+        """Split (id, site_name, fingerprint, cluster id) rows by (preference, language); unscored sources are left out."""
+        groups: dict[tuple[str, str], list[tuple[int, int, int | None]]] = {}
+        for article_id, site_name, fp, cluster_id in rows:
+            preference = get_preference(site_name)
+            if preference is None:
+                continue
+            key = (preference, get_language(site_name) or "English")
+            groups.setdefault(key, []).append((article_id, fp, cluster_id))
+        return groups
+
+    def _index(self, key: tuple[str, str]) -> SimHashIndex:
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = SimHashIndex(self._max_distance)
+            return index
+
+    def warm(self) -> None:
+        """(Re)build the indexes from the fingerprints within the window; also drops expired ones."""
+        if not self.enabled:
+            return
+        rows = db.get_fingerprints(since=datetime.now() - self._window)
+        indexes = {}
+        for key, group in self._group(rows).items():
+            indexes[key] = SimHashIndex(self._max_distance)
+            indexes[key].load(group)
+        with self._lock:
+            self._indexes = indexes
+        logger.info(f"Story cluster index loaded with {len(rows)} fingerprints")
+
+    def assign(self, article_ids: list[int]) -> list[int]:
+        """
+        Cluster freshly saved articles. Returns the ids that need scoring: the
+        representatives of new clusters (and articles without a fingerprint).
+        Blocking; run it in a worker thread.
+        """
+        if not self.enabled or not article_ids:
+            return article_ids
+        clusters: dict[int, int] = {}
+        for key, group in self._group(db.get_fingerprints(article_ids)).items():
+            clusters.update(self._index(key).assign(group))
+        db.set_clusters(list(clusters.items()))
+        duplicates = sum(1 for article_id, cluster_id in clusters.items() if article_id != cluster_id)
+        if duplicates:
+            self._clustered += duplicates
+            article_events.publish_scored(db.propagate_cluster_scores())
+        return [i for i in article_ids if clusters.get(i, i) == i]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "indexed": sum(len(index) for index in list(self._indexes.values())),
+            "clustered": self._clustered,
+        }
+
+
+story_clusters = StoryClusters()
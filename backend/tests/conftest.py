@@ -0,0 +1,17 @@
+"""
+Smoke tests for the backend. The modules are imported by name from backend/
+and db opens its database on import, so point it at a throwaway SQLite file
+first.
+
+  cd backend && python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.pop("DATABASE_URL", None)
+for name in ("OPENAI_API_BASE", "OPENAI_MODEL", "OPENAI_API_KEY"):
+    os.environ.setdefault(name, "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,34 @@
+import random
+import uuid
+
+import config
+import db
+from helper import simhash
+from storyClusters import StoryClusters
+
+_WORDS = ("bank rates inflation labour market tuesday rose fell analysts expect growth slowed "
+          "prices energy housing wages government budget deficit").split()
+
+
+def _save(site_names: list[str], text: str) -> list[int]:
+    return db.save_articles([
+        {"site_name": site_name, "url": f"https://example.com/{uuid.uuid4().hex}", "title": "Rates up",
+         "text": f"{text} {i}", "authors": None, "publish_date": None, "simhash": simhash(f"Rates up\n{text} {i}")}
+        for i, site_name in enumerate(site_names)
+    ])
+
+
+def test_near_duplicates_cluster_within_one_preference():
+    sources = [s for s in config.snapshot().sources if s.preference]
+    first = sources[0]
+    other = next(s for s in sources if s.preference != first.preference)
+    rng = random.Random(0)
+    text = " ".join(rng.choice(_WORDS) for _ in range(300))
+    representative, duplicate, elsewhere = _save([first.name, first.name, other.name], text)
+
+    clusters = StoryClusters(window_days=1)
+    assert clusters.assign([representative, duplicate, elsewhere]) == [representative, elsewhere]
+
+    db.set_scores([(row.url, 6, "Summary", None, None) for row in db.get_articles_by_ids([representative])])
+    propagated = db.propagate_cluster_scores()
+    assert [(row["id"], row["score"]) for row in propagated] == [(duplicate, 6)]
@@ -0,0 +1,24 @@
+import uuid
+
+import db
+from helper import canonical_url
+
+
+def _article(url: str, site_name: str = "Telex") -> dict:
+    return {"site_name": site_name, "url": url, "title": "Title", "text": "Some text.",
+            "authors": None, "publish_date": None}
+
+
+def test_saved_urls_are_found_by_canonical_key():
+    base = f"https://example.com/{uuid.uuid4().hex}"
+    inserted = db.save_articles([_article(base + "?utm_source=feed"), _article(base + "-other")])
+    assert len(inserted) == 2
+
+    keys = [canonical_url(base), canonical_url(base + "-new")]
+    assert db.find_existing_url_keys(keys) == {canonical_url(base)}
+
+
+def test_saving_an_existing_url_inserts_nothing():
+    url = f"https://example.com/{uuid.uuid4().hex}"
+    assert len(db.save_articles([_article(url)])) == 1
+    assert db.save_articles([_article(url)]) == []
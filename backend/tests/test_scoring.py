@@ -0,0 +1,65 @@
+import asyncio
+import uuid
+
+import db
+import estimateRelevance
+from estimateRelevance import ScoreQueue, score_writer
+
+
+def test_queue_scores_saved_articles(monkeypatch):
+    calls = []
+
+    async def fake_estimate_many(articles, usage=None):
+        calls.append([a.id for a in articles])
+        return {a.id: (7, f"Summary of {a.title}") for a in articles}
+
+    monkeypatch.setattr(estimateRelevance, "async_estimate_many", fake_estimate_many)
+    ids = db.save_articles([
+        {"site_name": "Telex", "url": f"https://example.com/{uuid.uuid4().hex}", "title": f"Story {i}",
+         "text": f"Unrelated text number {i}.", "authors": None, "publish_date": None}
+        for i in range(3)
+    ])
+
+    async def run():
+        queue = ScoreQueue(workers=1)
+        queue.start()
+        assert queue.put_many(ids) == len(ids)
+        await queue.join()
+        await queue.close()
+        await score_writer.flush()
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.scored == 3 and queue.failed == 0
+    assert sorted(i for batch in calls for i in batch) == sorted(ids)
+    for article in db.get_articles_by_ids(ids):
+        assert article.score == 7
+        assert article.summary == f"Summary of {article.title}"
+
+
+def test_cache_lookup_failure_falls_through(monkeypatch):
+    from scoreCache import ScoreCache
+
+    def broken(keys):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(db, "get_cached_scores", broken)
+    cache = ScoreCache(max_entries=10)
+    article = db.get_articles_by_ids(db.save_articles([
+        {"site_name": "Telex", "url": f"https://example.com/{uuid.uuid4().hex}", "title": "Cached",
+         "text": "Text.", "authors": None, "publish_date": None}
+    ]))[0]
+    assert asyncio.run(cache.lookup("model", [article])) == {}
+    assert cache.stats()["errors"] == 1
+
+
+def test_cache_hits_after_store():
+    from scoreCache import ScoreCache
+
+    cache = ScoreCache(max_entries=10)
+    article = db.get_articles_by_ids(db.save_articles([
+        {"site_name": "Telex", "url": f"https://example.com/{uuid.uuid4().hex}", "title": uuid.uuid4().hex,
+         "text": "Text.", "authors": None, "publish_date": None}
+    ]))[0]
+    asyncio.run(cache.store("model", [article], {article.id: (4, "Summary")}))
+    assert asyncio.run(cache.lookup("model", [article])) == {article.id: (4, "Summary")}
@@ -0,0 +1,109 @@
+"""
+Token counting and article text trimming for LLM prompts.
+
+Long-form articles can cost thousands of prompt tokens although the lead and
+a few key paragraphs are enough to judge relevance. trim_text keeps the text
+within a token budget (LLM_MAX_TEXT_TOKENS, or `max_tokens` of the source in
+sources.yaml): the lead paragraphs are always kept, the remaining budget goes
+to the paragraphs that share the most words with the title or carry figures,
+and the kept paragraphs stay in their original order.
+
+Tokens are counted with tiktoken when it's installed and its encoding can be
+loaded, otherwise estimated from the character count. tiktoken downloads the
+encoding on first use (set TIKTOKEN_CACHE_DIR to ship it with the app), so
+call load_encoding at startup, off the event loop.
+"""
+import logging
+import os
+import re
+from functools import lru_cache
+
+LLM_MAX_TEXT_TOKENS: int = int(os.getenv("LLM_MAX_TEXT_TOKENS", "1500"))
+
+_CHARS_PER_TOKEN = 4
+_LEAD_PARAGRAPHS = 2
+_GAP = "[...]"
+_WORD_RE = re.compile(r"\w{4,}")
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken  # pyright: ignore[reportMissingImports]
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Usually the BPE file download failing on a host without internet access.
+        logger.warning(f"Could not load the tiktoken encoding for {model!r}, estimating tokens from characters: {e}")
+        return None
+
+
+def load_encoding(model: str = "") -> bool:
+    """Load (and download if needed) the encoding for model. Blocking; returns whether tiktoken is used."""
+    return _encoding(model) is not None
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _cut(text: str, max_tokens: int, model: str) -> str:
+    """Cut a single paragraph to max_tokens, at a word boundary."""
+    encoding = _encoding(model)
+    if encoding is None:
+        cut = text[:max_tokens * _CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return cut.rsplit(" ", 1)[0] if " " in cut else cut
+
+
+def trim_text(text: str, title: str, max_tokens: int = LLM_MAX_TEXT_TOKENS, model: str = "") -> str:
+    """Return text reduced to about max_tokens tokens (unchanged if it already fits or max_tokens <= 0)."""
+    if max_tokens <= 0 or not text or count_tokens(text, model) <= max_tokens:
+        return text
+
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n|\n", text) if p.strip()]
+    costs = [count_tokens(p, model) for p in paragraphs]
+    keep: set[int] = set()
+    budget = max_tokens
+
+    for i in range(min(_LEAD_PARAGRAPHS, len(paragraphs))):
+        if costs[i] > budget:
+            break
+        keep.add(i)
+        budget -= costs[i]
+    if not keep:
+        return _cut(paragraphs[0], max_tokens, model)
+
+    title_words = {w.lower() for w in _WORD_RE.findall(title or "")}
+
+    def weight(i: int) -> float:
+        words = {w.lower() for w in _WORD_RE.findall(paragraphs[i])}
+        figures = len(re.findall(r"\d", paragraphs[i])) > 0
+        return len(words & title_words) + 0.5 * figures - 0.01 * i  # earlier paragraphs win ties
+
+    for i in sorted(range(len(paragraphs)), key=weight, reverse=True):
+        if i not in keep and costs[i] <= budget:
+            keep.add(i)
+            budget -= costs[i]
+
+    parts: list[str] = []
+    previous = -1
+    for i in sorted(keep):
+        if i != previous + 1:
+            parts.append(_GAP)
+        parts.append(paragraphs[i])
+        previous = i
+    if previous != len(paragraphs) - 1:
+        parts.append(_GAP)
+    return "\n\n".join(parts)
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef, useCallback } from 'react'
-import { getCategories, getCategoryArticles } from './api'
+import { getCategories, getCategoryArticles, subscribeCategory } from './api'
 import type { Article } from './types'
 import CategorySection from './components/CategorySection'
 import { SkeletonGrid } from './components/SkeletonCard'
@@ -52,7 +52,7 @@ const TIME_RANGE_LABELS: Record<TimeRange, string> = {
 function App() {
   const [categories, setCategories] = useState<string[]>([])
   const [articles, setArticles] = useState<Article[]>([])
-  const [totalArticles, setTotalArticles] = useState(0)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [activeCategory, setActiveCategory] = useState<string | null>(null)
   const [timeRange, setTimeRange] = useState<TimeRange>('today')
   const [slideDir, setSlideDir] = useState<'left' | 'right'>('left')
@@ -60,6 +60,7 @@ function App() {
   const [loading, setLoading] = useState(true)          // initial category load
   const [loadingArticles, setLoadingArticles] = useState(false) // article page load
   const [error, setError] = useState<string | null>(null)
+  const [reloadKey, setReloadKey] = useState(0)         // bumped when the live stream asks for a reload
   const dropdownRef = useRef<HTMLDivElement>(null)
   const touchStartX = useRef<number | null>(null)
   const touchStartY = useRef<number | null>(null)
@@ -120,14 +121,15 @@ function App() {
 
   // Fetch a page of articles; returns false if the fetch was stale
   const fetchPage = useCallback(
-    async (category: string, range: TimeRange, offset: number, currentFetchId: number) => {
+    async (category: string, range: TimeRange, cursor: string, currentFetchId: number) => {
       const since = getSinceDate(range)
       const until = getUntilDate(range)
       const res = await getCategoryArticles(category, {
         since,
         until,
         limit: PAGE_SIZE,
-        offset,
+        cursor,
+        include_total: false,
       })
       // If a newer fetch was started, discard these results
       if (fetchId.current !== currentFetchId) return false
@@ -142,15 +144,15 @@ function App() {
 
     const id = ++fetchId.current
     setArticles([])
-    setTotalArticles(0)
+    setNextCursor(null)
     setLoadingArticles(true)
     setError(null)
 
-    fetchPage(activeCategory, timeRange, 0, id)
+    fetchPage(activeCategory, timeRange, '', id)
       .then((res) => {
         if (!res) return // stale
         setArticles(sortArticles(res.articles))
-        setTotalArticles(res.total)
+        setNextCursor(res.next_cursor ?? null)
       })
       .catch(() => {
         if (fetchId.current !== id) return
@@ -159,19 +161,42 @@ function App() {
       .finally(() => {
         if (fetchId.current === id) setLoadingArticles(false)
       })
-  }, [activeCategory, timeRange, fetchPage])
+  }, [activeCategory, timeRange, fetchPage, reloadKey])
+
+  // Apply live updates (new articles, new scores) for the active category
+  useEffect(() => {
+    if (!activeCategory) return
+    return subscribeCategory(activeCategory, {
+      onAdded: (article) => {
+        // Only ranges that extend to now can gain articles
+        if (getUntilDate(timeRange) !== undefined) return
+        if (article.publish_date && article.publish_date < getSinceDate(timeRange)) return
+        setArticles((prev) => prev.some((a) => a.id === article.id) ? prev : sortArticles([...prev, article]))
+      },
+      onScored: (delta) => {
+        setArticles((prev) => prev.some((a) => a.id === delta.id)
+          ? sortArticles(prev.map((a) => (a.id === delta.id ? { ...a, ...delta } : a)))
+          : prev)
+      },
+      onReset: () => setReloadKey((k) => k + 1),
+    })
+  }, [activeCategory, timeRange])
 
   // Load more articles (called from CategorySection infinite scroll)
   const loadMore = useCallback(() => {
-    if (!activeCategory || loadingArticles || articles.length >= totalArticles) return
+    if (!activeCategory || loadingArticles || !nextCursor) return
     const id = fetchId.current // don't increment — same logical stream
     setLoadingArticles(true)
 
-    fetchPage(activeCategory, timeRange, articles.length, id)
+    fetchPage(activeCategory, timeRange, nextCursor, id)
       .then((res) => {
         if (!res) return
-        setArticles((prev) => sortArticles([...prev, ...res.articles]))
-        setTotalArticles(res.total)
+        setArticles((prev) => {
+          // Live updates may already have added some of these
+          const seen = new Set(prev.map((a) => a.id))
+          return sortArticles([...prev, ...res.articles.filter((a) => !seen.has(a.id))])
+        })
+        setNextCursor(res.next_cursor ?? null)
       })
       .catch(() => {
         if (fetchId.current === id) setError('Failed to load more articles.')
@@ -179,7 +204,7 @@ function App() {
       .finally(() => {
         if (fetchId.current === id) setLoadingArticles(false)
       })
-  }, [activeCategory, loadingArticles, articles.length, totalArticles, timeRange, fetchPage])
+  }, [activeCategory, loadingArticles, nextCursor, timeRange, fetchPage])
 
   const dateStr = new Date().toLocaleDateString(undefined, {
     weekday: 'long',
@@ -289,7 +314,7 @@ function App() {
               <CategorySection
                 category={activeCategory}
                 articles={articles}
-                hasMore={articles.length < totalArticles}
+                hasMore={nextCursor !== null}
                 loadingMore={loadingArticles}
                 onLoadMore={loadMore}
               />
@@ -1,9 +1,11 @@
 import axios from 'axios'
-import type { Article } from './types'
+import type { Article, ScoredDelta } from './types'
+
+const baseURL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
 // Point this at your FastAPI backend
 const api = axios.create({
-  baseURL: import.meta.env.VITE_API_URL || 'http://localhost:8000',
+  baseURL,
   timeout: 30000, // 30 seconds
 })
 
@@ -15,7 +17,9 @@ export async function getCategories(): Promise<string[]> {
 
 export interface PaginatedResponse {
   articles: Article[]
-  total: number
+  total: number | null  // null when requested with include_total=false
+  has_more: boolean
+  next_cursor?: string | null  // only present in cursor mode; null on the last page
 }
 
 /**
@@ -23,13 +27,18 @@ export interface PaginatedResponse {
  * Supports server-side date filtering and pagination.
  *
  * Backend endpoint needed:
- *   GET /api/categories/{category}/articles?since=ISO&until=ISO&limit=N&offset=N
- *   → { articles: list[dataArticle], total: int }
+ *   GET /api/categories/{category}/articles?since=ISO&until=ISO&limit=N&cursor=C
+ *   GET ...&include_total=false skips the COUNT(*) (total comes back null)
+ *   → { articles: list[dataArticle], total: int | null, has_more: bool, next_cursor: string | null }
  *   Articles sorted by score DESC (unscored at end), then by id hash for stable order.
+ *   Rows carry the compact list fields unless ?fields=a,b,c asks otherwise;
+ *   the full article (with text) is at GET /api/articles/{id}.
+ *   Pass cursor='' for the first page and the returned next_cursor afterwards;
+ *   the legacy offset=N parameter is still accepted.
  */
 export async function getCategoryArticles(
   category: string,
-  params?: { since?: string; until?: string; limit?: number; offset?: number },
+  params?: { since?: string; until?: string; limit?: number; offset?: number; cursor?: string; include_total?: boolean },
 ): Promise<PaginatedResponse> {
   const res = await api.get<PaginatedResponse>(
     `/api/categories/${encodeURIComponent(category)}/articles`,
@@ -37,3 +46,22 @@ export async function getCategoryArticles(
   )
   return res.data
 }
+
+export interface StreamHandlers {
+  onAdded: (article: Article) => void
+  onScored: (delta: ScoredDelta) => void
+  onReset: () => void  // events were missed; reload the list
+}
+
+/**
+ * Subscribes to new articles and scores in a category (server-sent events).
+ * The browser reconnects on its own and resumes via Last-Event-ID.
+ * Returns a function that closes the stream.
+ */
+export function subscribeCategory(category: string, handlers: StreamHandlers): () => void {
+  const source = new EventSource(`${baseURL}/api/categories/${encodeURIComponent(category)}/stream`)
+  source.addEventListener('added', (e) => handlers.onAdded(JSON.parse((e as MessageEvent).data)))
+  source.addEventListener('scored', (e) => handlers.onScored(JSON.parse((e as MessageEvent).data)))
+  source.addEventListener('reset', () => handlers.onReset())
+  return () => source.close()
+}
@@ -46,7 +46,7 @@ export default function ArticleCard({ article }: Props) {
     : null
 
   // Use LLM summary if available, otherwise fall back to a text snippet
-  const description = article.summary ?? article.text?.slice(0, 220)
+  const description = article.summary ?? article.snippet ?? article.text?.slice(0, 220)
 
   return (
     <a
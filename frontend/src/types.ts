@@ -1,13 +1,20 @@
-// Mirrors the backend `dataArticle` model from helper.py
+// Mirrors the backend `dataArticle` model from helper.py.
+// List endpoints return the compact db.LIST_FIELDS projection (no full text,
+// plus a short `snippet`); GET /api/articles/{id} returns every field.
 export interface Article {
   id: number
   site_name: string
   url: string
   title: string
-  text: string
-  authors: string | null
+  text?: string
+  snippet?: string | null // first ~220 characters of text
+  authors?: string | null
   publish_date: string   // ISO datetime string from FastAPI
   score: number          // -1 = not yet scored
   summary: string | null
-  created_at: string
+  provisional?: number   // 1 = estimated by the local pre-filter, not the LLM
+  created_at?: string
 }
+
+// Compact change events from GET /api/categories/{category}/stream
+export type ScoredDelta = Pick<Article, 'id' | 'site_name' | 'score' | 'summary' | 'provisional'>